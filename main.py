@@ -1,7 +1,8 @@
 import streamlit as st
+import pandas as pd
+from utils import startup, perf
 from views.login import login_page
-from views.forum import forum_page
-from views.dashboard import dashboard_page
+from utils.db import init_db
 
 # 页面配置
 st.set_page_config(
@@ -11,6 +12,12 @@ st.set_page_config(
 )
 
 def main():
+    # 打开了性能面板的会话记录本次运行各函数 / 页面区块的耗时；未打开时不记录
+    perf.begin_rerun(st.session_state.get("perf_panel", False))
+
+    # 数据库迁移 (每个进程只执行一次，之后的 rerun 直接返回)
+    init_db()
+
     # --- 会话恢复逻辑 (解决刷新掉线问题) ---
     # 如果 Session 中没有登录状态，但 URL 参数里有，则尝试恢复
     if "logged_in" not in st.session_state:
@@ -30,6 +37,9 @@ def main():
     # 路由控制
     if not st.session_state["logged_in"]:
         login_page()
+        startup.mark("login_page 首屏")
+        # 首屏之后再在后台预热其余页面
+        startup.warm_up_in_background()
     else:
         # 侧边栏导航
         with st.sidebar:
@@ -46,12 +56,59 @@ def main():
                 st.session_state.clear()
                 st.query_params.clear() # 同时清空 URL 参数
                 st.rerun()
+
+            st.checkbox("⏱️ 性能面板", key="perf_panel")
+            # 面板内容要等页面渲染完才有数据，先占住位置
+            perf_box = st.container()
                 
         # 根据选择渲染页面
+        # 广场与看板依赖 plotly / wordcloud / jieba 等重型库，第一次访问对应页面时才导入
         if menu == "问答广场":
-            forum_page()
+            with startup.timed("import views.forum"):
+                from views.forum import forum_page
+            with perf.span("view.forum_page"):
+                forum_page()
         elif menu == "科研看板":
-            dashboard_page()
+            with startup.timed("import views.dashboard"):
+                from views.dashboard import dashboard_page
+            with perf.span("view.dashboard_page"):
+                dashboard_page()
+
+        rerun = perf.end_rerun()
+        if rerun is not None and st.session_state.get("perf_panel"):
+            with perf_box:
+                _render_perf_panel(rerun)
+
+def _render_perf_panel(rerun):
+    """侧边栏性能面板：本次运行的耗时汇总与明细，以及进程内的累计直方图"""
+    elapsed = sum(seconds for _, depth, _, seconds in rerun.spans if depth == 0)
+    st.caption(f"本次运行中被计时的部分共 {elapsed * 1000:.0f} ms")
+
+    totals = pd.DataFrame(
+        [(name, calls, seconds * 1000) for name, (calls, seconds) in rerun.totals.items()],
+        columns=["函数 / 区块", "次数", "总耗时 ms"],
+    ).sort_values("总耗时 ms", ascending=False)
+    st.dataframe(totals, hide_index=True, use_container_width=True)
+
+    with st.expander("本次运行明细"):
+        timeline = pd.DataFrame(
+            [("　" * depth + name, start * 1000, seconds * 1000) for name, depth, start, seconds in rerun.spans],
+            columns=["函数 / 区块", "开始 ms", "耗时 ms"],
+        )
+        st.dataframe(timeline, hide_index=True, use_container_width=True)
+        if rerun.dropped:
+            st.caption(f"另有 {rerun.dropped} 次调用只计入上方汇总")
+
+    with st.expander("累计直方图 (本进程)"):
+        rows = [(name, n, total * 1000, mean * 1000, p95 * 1000, peak * 1000)
+                for name, n, total, mean, p95, peak in perf.summary()]
+        st.dataframe(pd.DataFrame(rows, columns=["函数 / 区块", "次数", "总耗时 ms", "平均 ms", "p95 ≤ ms", "最大 ms"]),
+                     hide_index=True, use_container_width=True)
+        st.download_button("下载 Prometheus 指标", perf.render_prometheus(),
+                           file_name="heartbridge_metrics.prom", mime="text/plain")
+        if st.button("清空累计数据", key="perf_reset"):
+            perf.reset()
+            st.rerun()
 
 if __name__ == "__main__":
     main()
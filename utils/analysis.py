@@ -1,143 +1,230 @@
-from snownlp import SnowNLP
 import pandas as pd
 from collections import Counter
 import jieba
-import random
+import hashlib
+import os
+import numpy as np
+from utils.matcher import LexiconMatcher
+from utils.sentiment_pool import snownlp_sentiments
+from utils import perf
+
+# jieba 前缀词典的序列化缓存：放在项目目录下 (而不是会被清空的系统临时目录)，
+# 之后每次启动直接反序列化，不再从词典文本重新构建。相对路径按项目根目录解析
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JIEBA_CACHE_FILE = os.path.join(PROJECT_ROOT, os.environ.get("HEARTBRIDGE_JIEBA_CACHE", ".cache/jieba.cache"))
+# 无论哪个进程先触发分词 (应用、维护脚本、基准测试)，缓存目录都已存在，缓存才能写入
+try:
+    os.makedirs(os.path.dirname(JIEBA_CACHE_FILE), exist_ok=True)
+except OSError:
+    pass
+jieba.dt.cache_file = JIEBA_CACHE_FILE
+
+def warm_up():
+    """预先加载 jieba 词典 (有缓存时直接读取缓存)，避免第一次分词时才卡顿"""
+    jieba.initialize()
+
+# --- 定义 5 级词库 ---
+# 为了解决中间区间(烦恼/期待)数据缺失的问题，我们采用“5级分层词典”策略。
+# 这能模拟 LLM 的分类效果，确保数据均匀分布在 5 个情感区间。
+
+# Level 1: 极度焦虑 (0.0 - 0.2)
+extreme_negative = ["死", "绝望", "崩溃", "痛苦", "窒息", "不想活", "滚", "垃圾", "地狱", "完蛋"]
+
+# Level 2: 轻度烦恼 (0.2 - 0.4)
+mild_negative = ["烦", "累", "讨厌", "无聊", "担心", "甚至", "唉", "压力", "难过", "郁闷", "不开心", "麻烦", "吵"]
+
+# Level 4: 积极期待 (0.6 - 0.8)
+mild_positive = ["期待", "努力", "相信", "不错", "还好", "加油", "愿望", "希望", "运气", "还行", "进步", "建议"]
+
+# Level 5: 极度温暖 (0.8 - 1.0)
+extreme_positive = ["爱", "幸福", "开心", "太棒", "感谢", "感动", "拥抱", "美好", "喜欢", "快乐", "你是最棒的"]
+
+# 唤醒度词库
+high_arousal = ["崩溃", "死", "绝望", "太棒", "冲", "滚", "必须", "绝对", "受不了", "!", "！", "？", "激动", "愤怒"]
+low_arousal = ["累", "睡", "无聊", "唉", "沉默", "发呆", "还行", "平淡", "休息", "算了"]
+
+# 效价层级：(层级名, 词库, 得分区间)，按命中优先级排列 (极端 > 轻度)
+VALENCE_TIERS = [
+    ("extreme_negative", extreme_negative, (0.05, 0.15)), # 落入 0.0-0.2
+    ("extreme_positive", extreme_positive, (0.85, 0.95)), # 落入 0.8-1.0
+    ("mild_negative", mild_negative, (0.25, 0.35)),       # 落入 0.2-0.4
+    ("mild_positive", mild_positive, (0.65, 0.75)),       # 落入 0.6-0.8
+]
+# 未命中任何词库，由 SnowNLP 给出中性区间内的分数
+NEUTRAL_TIER = "neutral"
+
+# 唤醒度层级：(命中标签, 得分区间)，按优先级排列；都未命中时落入中等区间
+AROUSAL_TIERS = [
+    ("high_arousal", (0.75, 0.95)),
+    ("low_arousal", (0.1, 0.3)),
+]
+AROUSAL_DEFAULT_RANGE = (0.4, 0.6)
+
+# 向量化计算用的查找表 (最后一行对应“未命中”)
+_TIER_NAMES = np.array([tier for tier, _, _ in VALENCE_TIERS] + [NEUTRAL_TIER], dtype=object)
+_VALENCE_RANGES = np.array([r for _, _, r in VALENCE_TIERS] + [(0.5, 0.5)])
+_AROUSAL_RANGES = np.array([r for _, r in AROUSAL_TIERS] + [AROUSAL_DEFAULT_RANGE])
+
+# 全部词库编译成一个自动机 (模块加载时构建一次)，每条帖子只扫描一遍
+LEXICON_MATCHER = LexiconMatcher({
+    "extreme_negative": extreme_negative,
+    "mild_negative": mild_negative,
+    "mild_positive": mild_positive,
+    "extreme_positive": extreme_positive,
+    "high_arousal": high_arousal,
+    "low_arousal": low_arousal,
+})
+
+def score_text(content):
+    """
+    单条文本的情感打分，返回 (valence, arousal, tier)。
+    tier 为命中的效价词库层级，未命中时为 'neutral'。
+    """
+    valence, arousal, tiers = _score_batch([content])
+    return float(valence[0]), float(arousal[0]), tiers[0]
+
+def score_texts(contents):
+    """
+    批量情感打分，返回与 contents 等长的 [(valence, arousal, tier), ...]。
+    整批向量化计算，未命中词库的文本一次交给 SnowNLP 执行器 (数量多时并行)。
+    """
+    valence, arousal, tiers = _score_batch(list(contents))
+    return [(float(v), float(a), t) for v, a, t in zip(valence, arousal, tiers)]
+
+def _score_batch(contents):
+    """
+    批量打分的核心实现，返回 (valence, arousal, tier) 三个等长数组。
+
+    每条文本扫描一遍词库自动机得到命中层级，再按层级区间 + 内容哈希抖动
+    对整批一次性向量化计算得分：相同内容永远得到相同分数，结果可以缓存。
+    """
+    n = len(contents)
+    tier_idx = np.full(n, len(VALENCE_TIERS))
+    arousal_idx = np.full(n, len(AROUSAL_TIERS))
+    for i, content in enumerate(contents):
+        hits = LEXICON_MATCHER.match(content)
+        # 命中判断逻辑 (优先级：极端 > 轻度 > 默认)
+        for t, (tier, _, _) in enumerate(VALENCE_TIERS):
+            if tier in hits:
+                tier_idx[i] = t
+                break
+        # 检查高唤醒，其次低唤醒
+        for t, (label, _) in enumerate(AROUSAL_TIERS):
+            if label in hits:
+                arousal_idx[i] = t
+                break
+
+    jitter = _content_jitter(contents)
+    low, high = _VALENCE_RANGES[tier_idx].T
+    valence = low + (high - low) * jitter[:, 0]
+    low, high = _AROUSAL_RANGES[arousal_idx].T
+    arousal = low + (high - low) * jitter[:, 1]
+
+    # 如果都没命中，使用 SnowNLP 但限制在“中性”区间 (整批交给执行器，数量多时并行)
+    neutral = np.flatnonzero(tier_idx == len(VALENCE_TIERS))
+    if len(neutral):
+        raw = snownlp_sentiments([contents[i] for i in neutral])
+        # 将 SnowNLP 的结果压缩到 0.4-0.6 之间，避免它随机乱跑；失败时取 0.5
+        valence[neutral] = [0.4 + (r * 0.2) if r is not None else 0.5 for r in raw]
+
+    return valence, arousal, _TIER_NAMES[tier_idx]
+
+def _content_jitter(contents):
+    """
+    由内容哈希得到确定性的 [0, 1) 抖动，形状为 (n, 2)：第一列给效价，第二列给唤醒度。
+    """
+    digests = b"".join(hashlib.blake2b(str(c).encode("utf-8"), digest_size=16).digest() for c in contents)
+    bits = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+    # 取高 53 位，保证结果严格小于 1
+    return (bits >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+# score_posts 返回的列
+SCORE_COLUMNS = ['valence', 'arousal', 'tier', 'snippet']
+
+def score_posts(df):
+    """
+    一次遍历完成一批帖子的情感打分，看板的 KPI 与情感罗盘共用这一份结果。
+
+    返回与 df 同索引的 DataFrame，列为 valence / arousal / tier / snippet。
+    发帖时已持久化得分的帖子直接沿用，其余帖子整批向量化计算。
+    """
+    if df.empty:
+        return pd.DataFrame(columns=SCORE_COLUMNS, index=df.index)
+
+    scored = pd.DataFrame({
+        'valence': _precomputed(df, 'valence'),
+        'arousal': _precomputed(df, 'arousal'),
+        'tier': df['tier'] if 'tier' in df.columns else None,
+    }, index=df.index)
+    missing = scored.isna().any(axis=1).to_numpy()
+    if missing.any():
+        valence, arousal, tiers = _score_batch(df['content'][missing].tolist())
+        # 按列原有的 dtype 写入 (投影查询返回的得分列是 float32)
+        scored.loc[missing, 'valence'] = np.asarray(valence, dtype=scored['valence'].dtype)
+        scored.loc[missing, 'arousal'] = np.asarray(arousal, dtype=scored['arousal'].dtype)
+        scored['tier'] = scored['tier'].astype(object)
+        scored.loc[missing, 'tier'] = tiers
+    # 截取部分内容用于 Hover (投影查询已在 SQL 端截好 snippet 列)
+    snippet = df['snippet'] if 'snippet' in df.columns else df['content'].str[:20]
+    scored['snippet'] = snippet + "..."
+    return scored
+
+def _precomputed(df, column):
+    """取出写入时已持久化的得分列 (缺失为 NaN)，没有该列时整列为 NaN"""
+    if column not in df.columns:
+        return np.nan
+    return pd.to_numeric(df[column], errors='coerce')
 
 def get_sentiment_analysis(df):
     """
-    计算情感得分 (5级层级策略版)。
-    
-    为了解决中间区间(烦恼/期待)数据缺失的问题，我们采用“5级分层词典”策略。
-    这能模拟 LLM 的分类效果，确保数据均匀分布在 5 个情感区间。
+    计算情感得分 (5级层级策略版)，返回 (平均效价, 每条帖子的效价列表)。
     """
     if df.empty:
         return 0.5, []
-    
-    # --- 定义 5 级词库 ---
-    
-    # Level 1: 极度焦虑 (0.0 - 0.2)
-    extreme_negative = ["死", "绝望", "崩溃", "痛苦", "窒息", "不想活", "滚", "垃圾", "地狱", "完蛋"]
-    
-    # Level 2: 轻度烦恼 (0.2 - 0.4)
-    mild_negative = ["烦", "累", "讨厌", "无聊", "担心", "甚至", "唉", "压力", "难过", "郁闷", "不开心", "麻烦", "吵"]
-    
-    # Level 4: 积极期待 (0.6 - 0.8)
-    mild_positive = ["期待", "努力", "相信", "不错", "还好", "加油", "愿望", "希望", "运气", "还行", "进步", "建议"]
-    
-    # Level 5: 极度温暖 (0.8 - 1.0)
-    extreme_positive = ["爱", "幸福", "开心", "太棒", "感谢", "感动", "拥抱", "美好", "喜欢", "快乐", "你是最棒的"]
-
-    scores = []
-    for content in df['content']:
-        score = 0.5 # 默认中性
-        
-        # 命中判断逻辑 (优先级：极端 > 轻度 > 默认)
-        is_hit = False
-        
-        # 1. 检查极端负面
-        for word in extreme_negative:
-            if word in content:
-                score = random.uniform(0.05, 0.15) # 落入 0.0-0.2
-                is_hit = True
-                break
-        
-        # 2. 检查极端正面 (如果未命中)
-        if not is_hit:
-            for word in extreme_positive:
-                if word in content:
-                    score = random.uniform(0.85, 0.95) # 落入 0.8-1.0
-                    is_hit = True
-                    break
-        
-        # 3. 检查轻度负面
-        if not is_hit:
-            for word in mild_negative:
-                if word in content:
-                    score = random.uniform(0.25, 0.35) # 落入 0.2-0.4
-                    is_hit = True
-                    break
-                    
-        # 4. 检查轻度正面
-        if not is_hit:
-            for word in mild_positive:
-                if word in content:
-                    score = random.uniform(0.65, 0.75) # 落入 0.6-0.8
-                    is_hit = True
-                    break
-        
-        # 5. 如果都没命中，使用 SnowNLP 但限制在“中性”区间
-        if not is_hit:
-            try:
-                s = SnowNLP(content)
-                raw_score = s.sentiments
-                # 将 SnowNLP 的结果压缩到 0.4-0.6 之间，避免它随机乱跑
-                score = 0.4 + (raw_score * 0.2)
-            except:
-                score = 0.5
-                
-        scores.append(score)
-            
+
+    scores = score_posts(df)['valence'].tolist()
     avg_score = sum(scores) / len(scores)
     return avg_score, scores
 
 def get_2d_sentiment_analysis(df):
     """
     二维情感分析：同时计算 效价 (Valence) 和 唤醒度 (Arousal)。
-    返回格式：[{'x': valence, 'y': arousal, 'label': content_snippet}, ...]
+    返回格式：[{'x': valence, 'y': arousal, 'content': content_snippet}, ...]
     """
     if df.empty:
         return []
-        
-    # 复用上面的 5级效价计算逻辑 (为了代码简洁，这里重新快速算一遍，或者重构)
-    # 这里我们直接调用上面的逻辑获取 valence
-    _, valence_scores = get_sentiment_analysis(df)
-    
-    # 定义唤醒度词库
-    high_arousal = ["崩溃", "死", "绝望", "太棒", "冲", "滚", "必须", "绝对", "受不了", "!", "！", "？", "激动", "愤怒"]
-    low_arousal = ["累", "睡", "无聊", "唉", "沉默", "发呆", "还行", "平淡", "休息", "算了"]
-    
-    results = []
-    for i, content in enumerate(df['content']):
-        valence = valence_scores[i]
-        
-        # 计算唤醒度 (默认为 0.5 中等)
-        arousal = random.uniform(0.4, 0.6)
-        
-        # 检查高唤醒
-        for word in high_arousal:
-            if word in content:
-                arousal = random.uniform(0.75, 0.95)
-                break
-        
-        # 检查低唤醒 (如果未命中高唤醒)
-        if arousal < 0.7:
-            for word in low_arousal:
-                if word in content:
-                    arousal = random.uniform(0.1, 0.3)
-                    break
-        
-        results.append({
+
+    scored = score_posts(df)
+    return [
+        {
             'x': valence,    # 效价 (不开心 -> 开心)
             'y': arousal,    # 唤醒度 (平静 -> 激动)
-            'content': content[:20] + "..." # 截取部分内容用于 Hover
-        })
-        
-    return results
+            'content': snippet
+        }
+        for valence, arousal, snippet in zip(scored['valence'], scored['arousal'], scored['snippet'])
+    ]
+
+# 过滤掉单字和常用停用词 (MVP 简单实现)
+STOP_WORDS = {"的", "了", "在", "是", "我", "你", "他", "它", "们", "这", "那", "都", "就", "也", "不"}
+
+def tokenize(text):
+    """
+    中文分词并过滤单字与停用词，返回词语列表。
+    发帖时的增量词频与全量重建共用这一规则，保证二者结果一致。
+    """
+    # 使用 jieba 进行分词
+    return [word for word in jieba.cut(text) if len(word) > 1 and word not in STOP_WORDS]
 
 def get_word_frequencies(df):
     """
-    简单的中文分词并统计词频。
+    简单的中文分词并统计词频，返回 Counter (没有帖子时为空 Counter)。
     """
     if df.empty:
-        return {}
-    
-    all_text = " ".join(df['content'].tolist())
-    # 使用 jieba 进行分词
-    words = jieba.cut(all_text)
-    
-    # 过滤掉单字和常用停用词 (MVP 简单实现)
-    stop_words = {"的", "了", "在", "是", "我", "你", "他", "它", "们", "这", "那", "都", "就", "也", "不"}
-    filtered_words = [word for word in words if len(word) > 1 and word not in stop_words]
-    
-    return Counter(filtered_words)
+        return Counter()
+
+    counts = Counter()
+    for content in df['content']:
+        counts.update(tokenize(content))
+    return counts
+
+perf.instrument(globals(), "analysis")
@@ -0,0 +1,193 @@
+"""
+数据库与分析热点函数的基准测试，在项目根目录执行：
+
+    python -m utils.benchmark                                 # 1k / 10k / 100k 帖子
+    python -m utils.benchmark --sizes 1000,10000 --output bench.json
+    python -m utils.benchmark --compare bench.json            # 与上次结果对比，变慢超过阈值时返回 1
+
+每个规模都在临时目录里新建数据库，用 seed_data 的合成语料填充，然后逐个函数
+先预热一次、再重复调用 (不超过 --repeat 次或 --max-time 秒)，记录：
+    p50_ms / p95_ms / mean_ms   单次调用耗时
+    calls_per_s / rows_per_s    吞吐 (每秒调用次数 / 每秒处理的帖子或评论行数)
+    peak_mem_mb                 单次调用期间 Python 侧 (含 numpy / pandas) 分配内存的峰值，
+                                在计时之外用 tracemalloc 单独测一次，不受语料生成和其他函数影响
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+def _cases(db, analysis):
+    """(函数名, 准备参数, 调用)：准备参数在计时之外执行，调用返回处理的行数"""
+    def post_ids():
+        return [str(pid) for (pid,) in db.get_connection().execute("SELECT id FROM posts").fetchall()]
+
+    def word_frequencies(df):
+        analysis.get_word_frequencies(df)
+        return len(df)
+
+    return [
+        ("get_posts", lambda: None,
+         lambda _: len(db.get_posts())),
+        ("get_posts_by_role", lambda: None,
+         lambda _: len(db.get_posts_by_role("家长"))),
+        ("get_comments", post_ids,
+         lambda ids: len(db.get_comments(random.choice(ids)))),
+        ("get_sentiment_analysis", db.get_posts,
+         lambda df: len(analysis.get_sentiment_analysis(df)[1])),
+        ("get_2d_sentiment_analysis", db.get_posts,
+         lambda df: len(analysis.get_2d_sentiment_analysis(df))),
+        ("get_word_frequencies", db.get_posts,
+         word_frequencies),
+    ]
+
+def run(sizes, repeat=20, max_time=10.0, comments=2, seed=0, only=None):
+    """对每个规模、每个函数跑一遍基准，返回结果列表"""
+    from utils import db, analysis, seed_data
+
+    if db.USE_GSHEETS:
+        raise RuntimeError("基准测试只支持 SQLite 模式")
+
+    results = []
+    original_db = db.DB_FILE
+    with tempfile.TemporaryDirectory(prefix="heartbridge-bench-") as tmp:
+        try:
+            for size in sizes:
+                db.close_connections()
+                db.DB_FILE = os.path.join(tmp, f"bench_{size}.db")
+                db.migrate()
+                posts, post_comments, word_counts = seed_data.generate(size, comments, seed=seed)
+                db.bulk_insert(posts, post_comments, word_counts)
+                del posts, post_comments, word_counts
+                print(f"📦 {size} 条帖子的语料已就绪")
+
+                random.seed(seed)
+                for name, prepare, call in _cases(db, analysis):
+                    if only and name not in only:
+                        continue
+                    result = _measure(call, prepare(), repeat, max_time)
+                    result.update(size=size, function=name)
+                    results.append(result)
+                    print(f"   {name:<28} p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms   "
+                          f"{result['rows_per_s']:12.0f} 行/秒   内存峰值 {result['peak_mem_mb']:8.2f} MB")
+        finally:
+            db.close_connections()
+            db.DB_FILE = original_db
+    return results
+
+def _measure(call, arg, repeat, max_time):
+    # 预热：第一次调用包含 jieba 词典加载、SQLite 页缓存填充等一次性开销
+    call(arg)
+    timings, rows = [], 0
+    deadline = time.perf_counter() + max_time
+    while len(timings) < repeat and (not timings or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        rows += call(arg)
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    return {
+        "calls": len(timings),
+        "p50_ms": float(np.percentile(timings, 50) * 1000),
+        "p95_ms": float(np.percentile(timings, 95) * 1000),
+        "mean_ms": total / len(timings) * 1000,
+        "calls_per_s": len(timings) / total if total else 0.0,
+        "rows_per_s": rows / total if total else 0.0,
+        "peak_mem_mb": _peak_mem_mb(call, arg),
+    }
+
+def _peak_mem_mb(call, arg):
+    """单次调用期间新分配内存的峰值 (MB)。tracemalloc 会拖慢执行，因此不与计时混在一起"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        call(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return (peak - baseline) / (1024 * 1024)
+
+# 内存峰值低于该值 (MB) 的函数不参与内存对比，避免小数值的抖动被当成回退
+MEM_COMPARE_FLOOR_MB = 0.5
+
+def compare(results, baseline, threshold):
+    """
+    与基线逐项对比 p50 耗时和内存峰值，返回超过基线 threshold 倍的
+    [(规模, 函数, 指标, 基线, 当前)]
+    """
+    base = {(r["size"], r["function"]): r for r in baseline["results"]}
+    regressions = []
+    print("📊 与基线对比 (p50 / 内存峰值):")
+    for r in results:
+        old = base.get((r["size"], r["function"]))
+        if old is None:
+            continue
+        checks = [("p50_ms", "ms")]
+        # 旧版本的结果文件没有 peak_mem_mb
+        if "peak_mem_mb" in old and max(old["peak_mem_mb"], r["peak_mem_mb"]) >= MEM_COMPARE_FLOOR_MB:
+            checks.append(("peak_mem_mb", "MB"))
+        for metric, unit in checks:
+            ratio = r[metric] / old[metric] if old[metric] else float("inf")
+            flag = "⚠️" if ratio > threshold else "  "
+            print(f"{flag} {r['size']:>7} {r['function']:<28} {old[metric]:9.2f} → {r[metric]:9.2f} {unit:<2}  ×{ratio:.2f}")
+            if ratio > threshold:
+                regressions.append((r["size"], r["function"], metric, old[metric], r[metric]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.benchmark", description="心桥热点函数基准测试")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="逗号分隔的帖子规模 (默认: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=20, help="每个函数最多调用次数 (默认: %(default)s)")
+    parser.add_argument("--max-time", type=float, default=10.0, help="每个函数最多计时秒数 (默认: %(default)s)")
+    parser.add_argument("--comments", type=int, default=2, help="每条帖子的评论数 (默认: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="语料随机种子 (默认: %(default)s)")
+    parser.add_argument("--only", default=None, help="只测逗号分隔的这些函数")
+    parser.add_argument("--output", default=None, help="结果写入的 JSON 文件")
+    parser.add_argument("--compare", default=None, help="作为基线对比的 JSON 结果文件")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="p50 耗时或内存峰值超过基线多少倍视为性能回退 (默认: %(default)s)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    only = set(args.only.split(",")) if args.only else None
+    results = run(sizes, repeat=args.repeat, max_time=args.max_time,
+                  comments=args.comments, seed=args.seed, only=only)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "comments_per_post": args.comments,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} 项性能回退超过 ×{args.threshold}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
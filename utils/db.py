@@ -1,205 +1,1271 @@
 import sqlite3
 import pandas as pd
 from datetime import datetime
+from collections import Counter
 import streamlit as st
 import random
+import threading
+import os
+import queue
+import time
+import atexit
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from utils import perf, sheets
 
 # 本地 SQLite 路径
 DB_FILE = 'heartbridge.db'
 
+# 旧版 SQLite 单条语句最多 999 个绑定参数
+SQLITE_MAX_PARAMS = 900
+
+POST_COLUMNS = ['id', 'role', 'nickname', 'title', 'content', 'is_hidden', 'created_at', 'likes',
+                'valence', 'arousal', 'tier']
+# 发帖时写入的情感得分列 (历史数据为空，需要回填)
+SENTIMENT_COLUMNS = ['valence', 'arousal', 'tier']
+COMMENT_COLUMNS = ['id', 'post_id', 'role', 'nickname', 'content', 'created_at']
+
+# init_db() 每个进程只需执行一次
+_DB_READY = False
+_INIT_LOCK = threading.Lock()
+
 # 检查是否配置了 Google Sheets 连接
 # 在 Streamlit Cloud 的 Secrets 里配置了 [connections.gsheets] 才会生效
-USE_GSHEETS = False
-if "connections" in st.secrets and "gsheets" in st.secrets["connections"]:
-    from streamlit_gsheets import GSheetsConnection
-    USE_GSHEETS = True
+def _gsheets_configured():
+    try:
+        return "connections" in st.secrets and "gsheets" in st.secrets["connections"]
+    except Exception:
+        # 没有 secrets.toml (例如在命令行运行维护脚本) 时退回 SQLite
+        return False
 
-def init_db():
+# HEARTBRIDGE_BACKEND=fakesheets 时用进程内的假表服务离线运行 GSheets 模式
+USE_GSHEETS = sheets.BACKEND == "fakesheets" or _gsheets_configured()
+
+# --- SQLite 连接管理 ---
+
+# 连接级 PRAGMA：WAL 让读写互不阻塞，NORMAL 同步级别在 WAL 下仍保证崩溃一致性
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    # SQLite 默认不检查外键，comments.post_id 的 ON DELETE CASCADE 需要显式打开
+    "PRAGMA foreign_keys=ON",
+]
+# 线程结束后保留的空闲连接上限
+MAX_IDLE_CONNECTIONS = 8
+
+class _ConnectionPool:
     """
-    初始化数据库。
-    SQLite: 建表 (posts, comments)。
-    GSheets: 检查 Worksheet 是否存在。
+    按线程分配的 SQLite 长连接池。
+    每个线程独占一条连接；线程结束后它的连接回到空闲列表，供新线程复用，
+    因此 Streamlit 每次 rerun 换新线程也不会反复开关连接、丢掉页缓存。
     """
-    if USE_GSHEETS:
-        # Google Sheets 模式由连接器自动管理
-        try:
-            conn = st.connection("gsheets", type=GSheetsConnection)
-            # 这里仅做连接测试，实际表结构由读写操作动态决定
-            pass 
-        except Exception as e:
-            print(f"GSheets 连接警告: {e}")
-    else:
-        # SQLite 模式
-        conn = sqlite3.connect(DB_FILE)
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_thread = {}
+        self._idle = []
+
+    def get(self):
+        ident = threading.get_ident()
+        conn = self._by_thread.get(ident)
+        if conn is not None:
+            return conn
+        with self._lock:
+            self._reclaim_dead_threads()
+            conn = self._idle.pop() if self._idle else self._open()
+            self._by_thread[ident] = conn
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in list(self._by_thread.values()) + self._idle:
+                conn.close()
+            self._by_thread.clear()
+            self._idle.clear()
+
+    def _open(self):
+        # 连接会在线程之间转交 (但同一时刻只属于一个线程)，因此关闭同线程检查
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _reclaim_dead_threads(self):
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._by_thread if i not in alive]:
+            conn = self._by_thread.pop(ident)
+            if conn.in_transaction:
+                conn.rollback()
+            if len(self._idle) < MAX_IDLE_CONNECTIONS:
+                self._idle.append(conn)
+            else:
+                conn.close()
+
+# 按数据库路径区分连接池 (DB_FILE 可被脚本 / 测试替换)
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_connection(path=None):
+    """返回当前线程的 SQLite 长连接 (首次使用时创建并设置 PRAGMA)"""
+    path = path or DB_FILE
+    pool = _POOLS.get(path)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.setdefault(path, _ConnectionPool(path))
+    return pool.get()
+
+def close_connections():
+    """关闭所有连接池中的连接 (维护脚本 / 测试结束时使用)"""
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.close_all()
+        _POOLS.clear()
+
+@contextmanager
+def transaction():
+    """
+    在当前线程的连接上开启一个写事务，正常退出提交，异常回滚。
+    显式 BEGIN IMMEDIATE：开头的 SELECT 也在事务内、持有写锁，读到的数据在提交前
+    不会被写线程 (或其他进程) 改动 (sqlite3 模块只会在 INSERT / UPDATE / DELETE 前隐式 BEGIN)。
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        yield c
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    bump_data_version()
+
+# --- 数据版本号 ---
+
+# 进程内单调递增的数据版本号：每次写入提交后 +1，共享快照以它为缓存键
+_data_version = 0
+_version_lock = threading.Lock()
+
+def data_version():
+    """当前数据版本号"""
+    return _data_version
+
+def bump_data_version():
+    """写入提交后调用，使所有基于旧版本的共享快照失效"""
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+
+# 点赞计数单独的版本号：点赞写入只让带 likes 列的帖子流快照失效，
+# 角色统计、情感罗盘、趋势等与点赞无关的快照不受影响
+_likes_version = 0
+
+def bump_likes_version():
+    """点赞增量落盘后调用"""
+    global _likes_version
+    with _version_lock:
+        _likes_version += 1
+
+# --- Google Sheets 读缓存 ---
+
+# 新鲜期 (秒)：期内直接返回缓存，不发网络请求
+GSHEETS_CACHE_TTL = float(os.environ.get("HEARTBRIDGE_GSHEETS_TTL", "30"))
+# 过期后仍可先返回旧数据、同时在后台刷新的时间窗 (秒)
+GSHEETS_STALE_TTL = float(os.environ.get("HEARTBRIDGE_GSHEETS_STALE", "300"))
+
+class _SheetCache:
+    """
+    GSheets 整表读取的进程级缓存，所有会话共享。
+    - 新鲜期内直接返回缓存；
+    - 过期但仍在 stale 窗口内：立即返回旧数据，并在后台线程刷新 (stale-while-revalidate)；
+    - 超出 stale 窗口、从未读取过或被本进程的写入作废：同步重新读取。
+      同一张表同时只有一个会话真正发起读取，其余会话等待并复用它的结果。
+    每张表有一个代数，invalidate() 时 +1；读取开始后表被本进程写过 (代数变了) 的结果
+    不会写入缓存，避免写入前发起的后台刷新把刚写入的数据覆盖掉。
+    返回的都是副本，调用方可以随意修改。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}
+        self._load_locks = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, worksheet, loader, fresh=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(worksheet)
+        if entry is not None and not fresh:
+            df, fetched_at = entry
+            age = now - fetched_at
+            if age < GSHEETS_CACHE_TTL:
+                return df.copy()
+            if age < GSHEETS_CACHE_TTL + GSHEETS_STALE_TTL:
+                self._refresh_in_background(worksheet, loader)
+                return df.copy()
+        return self._load_once(worksheet, loader, fresh).copy()
+
+    def invalidate(self, worksheet):
+        with self._lock:
+            self._entries.pop(worksheet, None)
+            self._generations[worksheet] = self._generations.get(worksheet, 0) + 1
+
+    def patch(self, worksheet, update):
+        """
+        原地修改缓存中的表 (update(df))，不作废缓存；同时推进代数，
+        修改前发起、尚未完成的读取不会再用旧数据覆盖缓存。
+        """
+        with self._lock:
+            entry = self._entries.get(worksheet)
+            if entry is not None:
+                update(entry[0])
+            self._generations[worksheet] = self._generations.get(worksheet, 0) + 1
+
+    def _load_once(self, worksheet, loader, fresh):
+        # single-flight：排队等锁期间别的会话已经读好 (且之后没有被作废) 时直接复用
+        requested_at = time.monotonic()
+        with self._lock:
+            load_lock = self._load_locks.setdefault(worksheet, threading.Lock())
+        with load_lock:
+            if not fresh:
+                with self._lock:
+                    entry = self._entries.get(worksheet)
+                if entry is not None and entry[1] >= requested_at:
+                    return entry[0]
+            return self._load(worksheet, loader)
+
+    def _load(self, worksheet, loader):
+        with self._lock:
+            generation = self._generations.get(worksheet, 0)
+        df = loader()
+        with self._lock:
+            if self._generations.get(worksheet, 0) != generation:
+                # 读取期间本进程写过这张表，结果可能不含这次写入，不放进缓存
+                return df
+            old = self._entries.get(worksheet)
+            self._entries[worksheet] = (df, time.monotonic())
+        # 表内容可能被其他进程改过：有变化时让共享快照失效
+        if old is not None and not old[0].equals(df):
+            bump_data_version()
+        return df
+
+    def _refresh_in_background(self, worksheet, loader):
+        with self._lock:
+            if worksheet in self._refreshing:
+                return
+            self._refreshing.add(worksheet)
+
+        def run():
+            try:
+                self._load(worksheet, loader)
+            except Exception as e:
+                # 刷新失败时继续使用旧数据，等下次过期再试
+                print(f"GSheets 后台刷新失败: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(worksheet)
+
+        threading.Thread(target=run, name="heartbridge-gsheets-refresh", daemon=True).start()
+
+_SHEET_CACHE = _SheetCache()
+
+def _read_sheet(worksheet=None, fresh=False):
+    """
+    读取整张 worksheet (None 为第一个，存帖子；"comments" 存评论)，返回规范化后的副本。
+    默认走进程级缓存；读-改-写之前传 fresh=True 直接读取最新数据。
+    """
+    service = sheets.get_sheets()
+
+    def load():
+        # 注意：Streamlit GSheet 连接器默认读第一个 sheet，读其他 sheet 需要指定 worksheet 参数
+        df = service.read(worksheet)
+        if not df.empty:
+            if worksheet is None:
+                df['created_at'] = pd.to_datetime(df['created_at'])
+                df['id'] = df['id'].astype(str)
+            else:
+                df['post_id'] = df['post_id'].astype(str)
+        return df
+
+    return _SHEET_CACHE.get(worksheet, load, fresh=fresh)
+
+_last_sheet_id = 0
+_sheet_id_lock = threading.Lock()
+
+def _new_sheet_id():
+    """
+    GSheets 行 id：毫秒时间戳。同一毫秒内连续追加时顺延 1，保证本进程内不重复。
+    """
+    global _last_sheet_id
+    with _sheet_id_lock:
+        _last_sheet_id = max(int(datetime.now().timestamp() * 1000), _last_sheet_id + 1)
+        return str(_last_sheet_id)
+
+def _sheet_written(worksheet=None):
+    """本进程写入 worksheet 之后调用：作废读缓存并推进数据版本号"""
+    _SHEET_CACHE.invalidate(worksheet)
+    bump_data_version()
+
+# --- 写入队列 (group commit) ---
+
+# 队列满时调用方阻塞，形成背压
+WRITE_QUEUE_SIZE = 1024
+# 收到第一条写操作后额外等待多久凑批 (秒)。
+# 默认不等待：上一批提交期间到达的写操作自然会合并进下一批
+GROUP_COMMIT_WINDOW = 0.0
+# 单批最多合并的写操作数
+GROUP_COMMIT_MAX_BATCH = 256
+
+class _WriteQueue:
+    """
+    后台写线程：把排队中的写操作合并进同一个事务提交 (group commit)，
+    每批只落盘一次。每个写操作在独立 SAVEPOINT 中执行，单个失败不影响同批其他操作；
+    事务提交成功后才通过 Future 返回结果，调用方拿到结果即可读到自己的写入。
+    stats 累计排队、等待写锁 (BEGIN IMMEDIATE) 和提交的耗时，用于观察写入争用。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"commits": 0, "ops": 0, "failed_commits": 0, "queue_wait_s": 0.0,
+                      "lock_wait_s": 0.0, "max_lock_wait_s": 0.0, "commit_s": 0.0}
+
+    def submit(self, op, on_commit=None):
+        """
+        提交写操作 op(cursor)，返回 Future，结果为 op 的返回值。
+        on_commit 在事务提交后、通知调用方之前执行，默认推进数据版本号。
+        """
+        self._ensure_running()
+        future = Future()
+        self._queue.put((DB_FILE, op, future, on_commit or bump_data_version, time.perf_counter()))
+        return future
+
+    def _ensure_running(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="heartbridge-db-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            while len(batch) < GROUP_COMMIT_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # 同一批里可能混有不同数据库文件的操作 (脚本切换了 DB_FILE)
+            by_path = {}
+            now = time.perf_counter()
+            for path, op, future, on_commit, queued_at in batch:
+                by_path.setdefault(path, []).append((op, future, on_commit))
+                self.stats["queue_wait_s"] += now - queued_at
+            for path, items in by_path.items():
+                self._commit(path, items)
+
+    def _commit(self, path, items):
+        conn = get_connection(path)
         c = conn.cursor()
-        
-        # 帖子表
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS posts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                role TEXT NOT NULL,
-                nickname TEXT NOT NULL,
-                title TEXT,
-                content TEXT NOT NULL,
-                is_hidden BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                likes INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # 评论表
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS comments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                post_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                nickname TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # 迁移检查
+        results = []
+        start = time.perf_counter()
         try:
-            c.execute("SELECT likes FROM posts LIMIT 1")
-        except sqlite3.OperationalError:
-            c.execute("ALTER TABLE posts ADD COLUMN likes INTEGER DEFAULT 0")
-            
-        conn.commit()
-        conn.close()
+            # 其他进程持有写锁时在这里等待 (最长 busy_timeout)
+            c.execute("BEGIN IMMEDIATE")
+            lock_wait = time.perf_counter() - start
+            self.stats["lock_wait_s"] += lock_wait
+            self.stats["max_lock_wait_s"] = max(self.stats["max_lock_wait_s"], lock_wait)
+            for op, future, on_commit in items:
+                c.execute("SAVEPOINT write_op")
+                try:
+                    results.append((future, op(c), None, on_commit))
+                    c.execute("RELEASE write_op")
+                except Exception as e:
+                    c.execute("ROLLBACK TO write_op")
+                    c.execute("RELEASE write_op")
+                    results.append((future, None, e, None))
+            c.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self.stats["failed_commits"] += 1
+            for _, future, _ in items:
+                future.set_exception(e)
+            return
+        self.stats["commits"] += 1
+        self.stats["ops"] += len(items)
+        self.stats["commit_s"] += time.perf_counter() - start
+
+        # 先让快照失效再通知调用方，调用方随后的读取一定能看到自己的写入
+        for on_commit in dict.fromkeys(on_commit for _, _, error, on_commit in results if error is None):
+            on_commit()
+
+        for future, value, error, _ in results:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+_WRITER = _WriteQueue()
+
+def submit_write(op, on_commit=None):
+    """
+    异步提交写操作：op(cursor) 会在后台写线程的事务里执行。
+    返回 Future，future.result() 在事务提交后返回 op 的返回值。
+    on_commit 为提交后让读取方看到新数据的回调，默认推进数据版本号。
+    """
+    return _WRITER.submit(op, on_commit)
+
+def write_stats():
+    """写线程的累计统计 (提交次数、写操作数、排队 / 等锁 / 提交耗时)"""
+    return dict(_WRITER.stats)
+
+def flush_writes():
+    """等待此前提交的所有写操作 (包括缓冲中的点赞增量) 落盘"""
+    _LIKES.flush()
+    if not USE_GSHEETS:
+        # 空操作只用来等待队列排空，不需要让快照失效
+        submit_write(lambda c: None, on_commit=lambda: None).result()
+
+# --- 点赞计数缓冲 (write-behind) ---
+
+# 缓冲中的点赞增量最多停留多久 (秒) 就写入存储
+LIKE_FLUSH_INTERVAL = float(os.environ.get("HEARTBRIDGE_LIKE_FLUSH_INTERVAL", "1.0"))
+# 累计点击达到多少次时不等间隔，立即写入
+LIKE_FLUSH_THRESHOLD = int(os.environ.get("HEARTBRIDGE_LIKE_FLUSH_THRESHOLD", "64"))
+
+class _LikeBuffer:
+    """
+    点赞计数的写回缓冲，所有会话共享。
+    点赞 / 取消点赞只在内存里累加各帖子的增量；后台线程每隔 LIKE_FLUSH_INTERVAL 秒、
+    或累计点击达到 LIKE_FLUSH_THRESHOLD 次时，把全部增量合并成一次批量写入，
+    热门帖子被密集点赞时每轮也只写一次。展示时用 pending() 把尚未落盘的增量
+    加到已存储的计数上。进程异常退出时最多丢失一个间隔内的点赞。
+    """
+
+    def __init__(self):
+        self._pending = Counter()
+        self._inflight = Counter()
+        self._clicks = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, post_id, delta):
+        with self._lock:
+            self._pending[str(post_id)] += delta
+            self._clicks += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="heartbridge-like-flusher", daemon=True)
+                self._thread.start()
+            if self._clicks >= LIKE_FLUSH_THRESHOLD:
+                self._wake.set()
+
+    def pending(self, post_ids):
+        """{post_id: 尚未落盘的增量}，没有增量的帖子不出现在结果中"""
+        with self._lock:
+            deltas = {}
+            for pid in map(str, post_ids):
+                delta = self._pending[pid] + self._inflight[pid]
+                if delta:
+                    deltas[pid] = delta
+            return deltas
+
+    def flush(self):
+        """把当前缓冲的增量写入存储，返回写入的帖子数"""
+        with self._flush_lock:
+            with self._lock:
+                self._inflight, self._pending = self._pending, Counter()
+                self._clicks = 0
+                deltas = {pid: delta for pid, delta in self._inflight.items() if delta}
+            failed = _write_like_deltas(deltas, self._written) if deltas else {}
+            with self._lock:
+                # 写入失败的增量放回缓冲，下一轮再试
+                self._pending.update(failed)
+                self._inflight = Counter()
+            return len(deltas) - len(failed)
+
+    def _written(self, post_ids, publish):
+        """
+        增量已经写入存储：publish() 让读取方看到新的计数，并在同一个临界区里
+        去掉这些帖子的在途增量，展示时不会把同一次点赞算两遍。
+        """
+        with self._lock:
+            publish()
+            for pid in post_ids:
+                self._inflight.pop(pid, None)
+
+    def _run(self):
+        while True:
+            self._wake.wait(LIKE_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+def _write_like_deltas(deltas, written):
+    """
+    批量写入 {post_id: 增量}，返回写入失败的部分。
+    写入成功后调用 written(post_ids, publish)。点赞只推进点赞版本号：
+    GSheets 模式原地更新缓存中的 likes 列，不作废整表缓存。
+    """
+    if USE_GSHEETS:
+        service = sheets.get_sheets()
+        failed = {}
+        values = {}
+        for pid, delta in deltas.items():
+            try:
+                value = service.add_to_cell(None, 'id', pid, 'likes', delta, minimum=0)
+            except Exception as e:
+                print(f"点赞计数写入失败 ({pid}): {e}")
+                failed[pid] = delta
+                continue
+            if value is not None:
+                values[pid] = value
+
+        def update(df):
+            if 'likes' in df.columns:
+                rows = df['id'].isin(list(values))
+                df.loc[rows, 'likes'] = df.loc[rows, 'id'].map(values)
+
+        def publish():
+            _SHEET_CACHE.patch(None, update)
+            bump_likes_version()
+
+        written([pid for pid in deltas if pid not in failed], publish)
+        return failed
+
+    params = [(delta, int(pid)) for pid, delta in deltas.items()]
+    try:
+        submit_write(lambda c: c.executemany(
+            "UPDATE posts SET likes = MAX(0, likes + ?) WHERE id = ?", params
+        ), on_commit=lambda: written(list(deltas), bump_likes_version)).result()
+    except Exception as e:
+        print(f"点赞计数写入失败: {e}")
+        return deltas
+    return {}
+
+_LIKES = _LikeBuffer()
+# 正常退出时把缓冲中的增量写完
+atexit.register(_LIKES.flush)
+
+def pending_likes(post_ids):
+    """尚未写入存储的点赞增量 {post_id: delta}，展示点赞数时与存储值相加"""
+    return _LIKES.pending(post_ids)
+
+def init_db():
+    """
+    初始化数据库 (每个进程只真正执行一次)。
+    SQLite: 按版本号顺序执行尚未应用的迁移。
+    GSheets: 检查 Worksheet 是否存在。
+    """
+    global _DB_READY
+    if _DB_READY:
+        return
+    with _INIT_LOCK:
+        if _DB_READY:
+            return
+        if USE_GSHEETS:
+            # Google Sheets 模式由连接器自动管理
+            try:
+                sheets.get_sheets()
+                # 这里仅做连接测试，实际表结构由读写操作动态决定
+                pass 
+            except Exception as e:
+                print(f"GSheets 连接警告: {e}")
+        else:
+            migrate()
+        _DB_READY = True
+
+def migrate():
+    """
+    执行所有尚未应用的迁移，返回迁移后的结构版本号。
+    每个迁移在独立事务中执行，成功后写入 schema_version 表。
+    多个进程同时启动时，拿到写锁后重新读取版本号，已被其他进程应用的迁移直接跳过。
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    current = c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+    if current >= MIGRATIONS[-1][0]:
+        return current
+
+    # 重建表的迁移期间关闭外键检查 (SQLite 官方建议的做法，事务内无法切换)，结束后再打开
+    c.execute("PRAGMA foreign_keys=OFF")
+    try:
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            # 显式开启事务，DDL 与版本记录一起提交或回滚
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                current = c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+                if version <= current:
+                    c.execute("COMMIT")
+                    continue
+                apply(c)
+                c.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+            current = version
+            bump_data_version()
+    finally:
+        c.execute("PRAGMA foreign_keys=ON")
+    return current
+
+# --- 结构迁移 (只能追加，不能修改已发布的迁移) ---
+
+def _migrate_create_tables(c):
+    # 帖子表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            role TEXT NOT NULL,
+            nickname TEXT NOT NULL,
+            title TEXT,
+            content TEXT NOT NULL,
+            is_hidden BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            likes INTEGER DEFAULT 0
+        )
+    ''')
+    
+    # 评论表
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            nickname TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migrate_add_likes(c):
+    # 早期数据库的 posts 表没有 likes 列
+    columns = [row[1] for row in c.execute("PRAGMA table_info(posts)")]
+    if "likes" not in columns:
+        c.execute("ALTER TABLE posts ADD COLUMN likes INTEGER DEFAULT 0")
+
+def _migrate_comments_post_id_integer(c):
+    # SQLite 不支持修改列类型，只能重建表
+    c.execute('''
+        CREATE TABLE comments_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id INTEGER NOT NULL REFERENCES posts(id) ON DELETE CASCADE,
+            role TEXT NOT NULL,
+            nickname TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        INSERT INTO comments_new (id, post_id, role, nickname, content, created_at)
+        SELECT id, CAST(post_id AS INTEGER), role, nickname, content, created_at FROM comments
+    ''')
+    c.execute("DROP TABLE comments")
+    c.execute("ALTER TABLE comments_new RENAME TO comments")
+
+def _migrate_add_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_comments_post_created ON comments(post_id, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_posts_role_created ON posts(role, created_at)")
+    # 不按角色过滤的全量倒序查询 (看板) 使用
+    c.execute("CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created_at)")
+
+def _migrate_add_sentiment(c):
+    # 发帖时计算并持久化情感得分，看板直接读取
+    c.execute("ALTER TABLE posts ADD COLUMN valence REAL")
+    c.execute("ALTER TABLE posts ADD COLUMN arousal REAL")
+    c.execute("ALTER TABLE posts ADD COLUMN tier TEXT")
+
+def _migrate_add_word_freq(c):
+    # 按 (角色, 词语) 增量维护的词频表，词云直接读取 Top-K
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS word_freq (
+            role TEXT NOT NULL,
+            token TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (role, token)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_word_freq_role_count ON word_freq(role, count DESC)")
+    # 用已有帖子建立初始词频
+    _rebuild_word_freq(c)
+
+def _migrate_add_sentiment_rollup(c):
+    # 按 (粒度, 时间桶, 角色) 汇总的情感统计，趋势图直接读取
+    tier_columns = ", ".join(f"n_{tier} INTEGER NOT NULL DEFAULT 0" for tier in ROLLUP_TIERS)
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS sentiment_rollup (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            role TEXT NOT NULL,
+            posts INTEGER NOT NULL,
+            valence_sum REAL NOT NULL,
+            arousal_sum REAL NOT NULL,
+            {tier_columns},
+            PRIMARY KEY (granularity, bucket, role)
+        ) WITHOUT ROWID
+    ''')
+    # 用已有帖子建立初始汇总
+    _rebuild_sentiment_rollup(c)
+
+# (版本号, 说明, 迁移函数)，版本号严格递增
+MIGRATIONS = [
+    (1, "create posts and comments tables", _migrate_create_tables),
+    (2, "add posts.likes", _migrate_add_likes),
+    (3, "comments.post_id as INTEGER foreign key", _migrate_comments_post_id_integer),
+    (4, "indexes for feed and comment lookups", _migrate_add_indexes),
+    (5, "persisted sentiment scores on posts", _migrate_add_sentiment),
+    (6, "per-role word frequency index", _migrate_add_word_freq),
+    (7, "time-bucketed sentiment rollup", _migrate_add_sentiment_rollup),
+]
 
 def get_posts():
     """获取所有帖子"""
+    df, _ = query_posts()
+    return df
+
+def get_posts_by_role(target_role):
+    """按角色筛选"""
+    df, _ = query_posts(role=target_role)
+    return df
+
+def query_posts(role=None, columns=None, limit=None, cursor=None):
+    """
+    按条件查询帖子，过滤 / 投影 / 排序 / 分页全部下推到 SQLite。
+
+    按 (created_at, id) 倒序做游标 (keyset) 分页：cursor 传上一页返回的 next_cursor，
+    返回 (df, next_cursor)；next_cursor 为 None 表示没有更多数据。
+    columns 为需要的列 (id 与 created_at 总会带上，用于生成游标)。
+    """
+    projection = _project_columns(columns)
+
     if USE_GSHEETS:
-        conn = st.connection("gsheets", type=GSheetsConnection)
         try:
             # 默认读取第一个 worksheet
-            df = conn.read(ttl=0)
-            if not df.empty:
-                df['created_at'] = pd.to_datetime(df['created_at'])
-                df['id'] = df['id'].astype(str)
-                df = df.sort_values(by='created_at', ascending=False)
-            return df
+            df = _read_sheet()
         except Exception:
-            return pd.DataFrame(columns=['id', 'role', 'nickname', 'title', 'content', 'is_hidden', 'created_at', 'likes'])
+            return pd.DataFrame(columns=projection), None
+        if df.empty:
+            return pd.DataFrame(columns=projection), None
+        if role is not None:
+            df = df[df['role'] == role]
+        df = df.sort_values(by=['created_at', 'id'], ascending=False)
+        if cursor is not None:
+            last_created_at, last_id = pd.Timestamp(cursor[0]), str(cursor[1])
+            df = df[(df['created_at'] < last_created_at) |
+                    ((df['created_at'] == last_created_at) & (df['id'] < last_id))]
+        if limit is not None:
+            df = df.head(limit)
+        if columns is not None:
+            # 只在指定了投影时裁剪列；未指定时返回表中实际存在的全部列 (与 get_posts 一致)
+            df = df[[col for col in projection if col in df.columns]]
+        next_cursor = None
+        if limit is not None and len(df) == limit:
+            next_cursor = (df['created_at'].iloc[-1], df['id'].iloc[-1])
+        return df, next_cursor
     else:
-        conn = sqlite3.connect(DB_FILE)
+        where, params = [], []
+        if role is not None:
+            where.append("role = ?")
+            params.append(role)
+        if cursor is not None:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend([cursor[0], int(cursor[1])])
+        sql = f"SELECT {', '.join(projection)} FROM posts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
         try:
-            df = pd.read_sql_query("SELECT * FROM posts ORDER BY created_at DESC", conn)
-            df['id'] = df['id'].astype(str)
+            df = pd.read_sql_query(sql, get_connection(), params=params)
         except:
-            df = pd.DataFrame()
-        finally:
-            conn.close()
-        return df
+            return pd.DataFrame(columns=projection), None
 
-def get_posts_by_role(target_role):
-    """按角色筛选"""
-    df = get_posts()
-    if df.empty:
-        return df
-    return df[df['role'] == target_role]
+        next_cursor = None
+        if limit is not None and len(df) == limit:
+            next_cursor = (df['created_at'].iloc[-1], int(df['id'].iloc[-1]))
+        df['id'] = df['id'].astype(str)
+        return df, next_cursor
+
+# --- 跨会话共享的只读快照 ---
+
+def query_posts_snapshot(role=None, columns=None, limit=None, cursor=None):
+    """query_posts 的共享快照版本 (只读)，参数与返回值同 query_posts"""
+    columns = tuple(columns) if columns is not None else None
+    cursor = tuple(cursor) if cursor is not None else None
+    # 不含 likes 列的投影不随点赞失效
+    likes_version = _likes_version if columns is None or 'likes' in columns else None
+    return _query_posts_snapshot(_data_version, likes_version, DB_FILE, role, columns, limit, cursor)
+
+# 各会话浏览的分页大体相同 (前几页)，按页共享
+@st.cache_resource(max_entries=64, show_spinner=False)
+def _query_posts_snapshot(version, likes_version, db_file, role, columns, limit, cursor):
+    return query_posts(role=role, columns=list(columns) if columns else None, limit=limit, cursor=cursor)
+
+# --- 看板分析查询 ---
+
+# 情感罗盘悬停提示截取的正文长度
+SNIPPET_LENGTH = 20
+
+def get_role_counts():
+    """各角色的帖子数 {role: count}，SQLite 用 GROUP BY 聚合，不读取任何正文"""
+    if USE_GSHEETS:
+        try:
+            df = _read_sheet()
+        except Exception:
+            return {}
+        if df.empty:
+            return {}
+        return {role: int(n) for role, n in df['role'].value_counts().items()}
+    try:
+        rows = get_connection().execute("SELECT role, COUNT(*) FROM posts GROUP BY role").fetchall()
+    except sqlite3.Error:
+        return {}
+    return dict(rows)
+
+def query_sentiment_points():
+    """
+    看板情感分析的投影查询：只取 role / valence / arousal / tier 和正文前 SNIPPET_LENGTH 个字 (snippet)。
+    完整正文 (content) 只为还没有得分、需要现场打分的帖子读取，其余为空值，
+    因此内存占用不随正文的累积而增长。role、tier 为 category 类型，得分为 float32。
+    """
+    columns = ['role', 'valence', 'arousal', 'tier', 'snippet', 'content']
+    if USE_GSHEETS:
+        try:
+            df = _read_sheet()
+        except Exception:
+            return _compact_dtypes(pd.DataFrame(columns=columns))
+        if df.empty:
+            return _compact_dtypes(pd.DataFrame(columns=columns))
+        for col in SENTIMENT_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        df['snippet'] = df['content'].astype(str).str[:SNIPPET_LENGTH]
+        df['content'] = df['content'].where(df[SENTIMENT_COLUMNS].isna().any(axis=1))
+        return _compact_dtypes(df[columns])
+    try:
+        df = pd.read_sql_query(f'''
+            SELECT role, valence, arousal, tier, substr(content, 1, {SNIPPET_LENGTH}) AS snippet,
+                   CASE WHEN valence IS NULL OR arousal IS NULL OR tier IS NULL THEN content END AS content
+            FROM posts
+        ''', get_connection())
+    except:
+        df = pd.DataFrame(columns=columns)
+    return _compact_dtypes(df)
+
+def _compact_dtypes(df):
+    """取值很少的文本列转为 category，得分列转为 float32"""
+    df['role'] = df['role'].astype('category')
+    df['tier'] = df['tier'].astype('category')
+    for col in ('valence', 'arousal'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+    return df
+
+def role_counts_snapshot():
+    """get_role_counts 的共享快照 (只读)"""
+    return _role_counts_snapshot(_data_version, DB_FILE)
+
+def sentiment_points_snapshot():
+    """query_sentiment_points 的共享快照 (只读，调用方不要原地修改)"""
+    return _sentiment_points_snapshot(_data_version, DB_FILE)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _role_counts_snapshot(version, db_file):
+    return get_role_counts()
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _sentiment_points_snapshot(version, db_file):
+    return query_sentiment_points()
+
+def _project_columns(columns):
+    """校验投影列 (只允许 posts 表已知列，防止拼接 SQL)，并补齐游标所需的列"""
+    if columns is None:
+        return list(POST_COLUMNS)
+    unknown = set(columns) - set(POST_COLUMNS)
+    if unknown:
+        raise ValueError(f"未知的帖子字段: {sorted(unknown)}")
+    return [col for col in POST_COLUMNS if col in columns or col in ('id', 'created_at')]
 
 def add_post(role, nickname, title, content, is_hidden=False):
-    """新增帖子"""
+    """新增帖子 (同时计算并保存情感得分)，返回新帖子的 id"""
+    # 延迟导入：分析模块依赖 SnowNLP / jieba，只有写帖子时才需要
+    from utils.analysis import score_text, tokenize
+    valence, arousal, tier = score_text(content)
+    # 分词在调用方线程完成，写线程只负责累加计数
+    token_counts = Counter(tokenize(content))
+
     new_data = {
-        "id": str(int(datetime.now().timestamp() * 1000)),
+        "id": _new_sheet_id(),
         "role": role,
         "nickname": nickname,
         "title": title,
         "content": content,
         "is_hidden": is_hidden,
         "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "likes": 0
+        "likes": 0,
+        "valence": valence,
+        "arousal": arousal,
+        "tier": tier
     }
     
     if USE_GSHEETS:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        df = get_posts()
-        updated_df = pd.concat([df, pd.DataFrame([new_data])], ignore_index=True)
-        conn.update(data=updated_df)
+        # 只追加一行，不再整表读出再写回
+        sheets.get_sheets().append_row(None, new_data)
+        _sheet_written()
+        return new_data["id"]
     else:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO posts (role, nickname, title, content, is_hidden, created_at, likes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (role, nickname, title, content, is_hidden, datetime.now(), 0))
-        conn.commit()
-        conn.close()
+        def op(c):
+            created_at = datetime.now()
+            c.execute('''
+                INSERT INTO posts (role, nickname, title, content, is_hidden, created_at, likes, valence, arousal, tier)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (role, nickname, title, content, is_hidden, created_at, 0, valence, arousal, tier))
+            post_id = c.lastrowid
+            _add_word_counts(c, role, token_counts)
+            _add_to_rollup(c, [(role, created_at, valence, arousal, tier)])
+            return post_id
+        # 等待写线程确认提交，保证本会话随后的读取能看到这条帖子
+        return submit_write(op).result()
 
 def like_post(post_id):
-    """点赞 (+1)"""
-    post_id = str(post_id)
-    if USE_GSHEETS:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        df = get_posts()
-        if not df.empty:
-            mask = df['id'] == post_id
-            if mask.any():
-                df.loc[mask, 'likes'] = df.loc[mask, 'likes'].astype(int) + 1
-                conn.update(data=df)
-    else:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("UPDATE posts SET likes = likes + 1 WHERE id = ?", (post_id,))
-        conn.commit()
-        conn.close()
+    """点赞 (+1)，先记入缓冲，由后台线程批量写入"""
+    _LIKES.add(post_id, 1)
 
 def unlike_post(post_id):
-    """取消点赞 (-1)"""
-    post_id = str(post_id)
+    """取消点赞 (-1)，先记入缓冲，由后台线程批量写入"""
+    _LIKES.add(post_id, -1)
+
+def backfill_sentiment(batch_size=500):
+    """
+    为还没有情感得分的历史帖子补算并保存得分 (同时计入情感汇总表、重建词频表)，返回处理的帖子数。
+    SQLite 按批次读取 / 更新，避免一次把全部正文读进内存；每批一次性打分。
+    """
+    from utils.analysis import score_texts
+
     if USE_GSHEETS:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        df = get_posts()
-        if not df.empty:
-            mask = df['id'] == post_id
-            if mask.any():
-                current_likes = int(df.loc[mask, 'likes'].values[0])
-                df.loc[mask, 'likes'] = max(0, current_likes - 1)
-                conn.update(data=df)
+        df = _read_sheet(fresh=True)
+        if df.empty:
+            return 0
+        for col in SENTIMENT_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        missing = df['valence'].isna()
+        for start in range(0, int(missing.sum()), batch_size):
+            idx = df.index[missing][start:start + batch_size]
+            scores = score_texts(df.loc[idx, 'content'].tolist())
+            df.loc[idx, SENTIMENT_COLUMNS] = pd.DataFrame(scores, index=idx, columns=SENTIMENT_COLUMNS)
+        if missing.any():
+            # 维护操作，整表写回
+            sheets.get_sheets().write_all(None, df)
+            _sheet_written()
+        return int(missing.sum())
+
+    total = 0
+    last_id = 0
+    conn = get_connection()
+    while True:
+        rows = conn.execute(
+            "SELECT id, role, created_at, content FROM posts WHERE valence IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        scores = score_texts([content for _, _, _, content in rows])
+        with transaction() as c:
+            c.executemany(
+                "UPDATE posts SET valence = ?, arousal = ?, tier = ? WHERE id = ?",
+                [(*score, row[0]) for row, score in zip(rows, scores)]
+            )
+            # 补算出得分的帖子同时计入情感汇总表
+            _add_to_rollup(c, [(role, created_at, *score) for (_, role, created_at, _), score in zip(rows, scores)])
+        total += len(rows)
+        last_id = rows[-1][0]
+
+    if total:
+        # 没有得分的帖子是绕过 add_post 直接写库的，可能不在词频表里；
+        # 也可能已被迁移 6 计入过，逐条累加会重复计数，因此整体重建一次
+        rebuild_word_freq()
+    return total
+
+# --- 词频索引 ---
+
+def get_top_tokens(role, k=200):
+    """某个角色最高频的 k 个词语，返回 {token: count} (按频次降序)"""
+    if USE_GSHEETS:
+        # GSheets 没有词频表，按数据版本缓存现场统计的结果，没有新写入时不再重新分词
+        return dict(_sheet_top_tokens(_data_version, DB_FILE, role, k))
+
+    rows = get_connection().execute(
+        "SELECT token, count FROM word_freq WHERE role = ? ORDER BY count DESC LIMIT ?", (role, k)
+    ).fetchall()
+    return dict(rows)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _sheet_top_tokens(version, db_file, role, k):
+    from utils.analysis import get_word_frequencies
+    return dict(get_word_frequencies(get_posts_by_role(role)).most_common(k))
+
+def rebuild_word_freq():
+    """按现有帖子全量重建词频表 (修改分词 / 停用词规则后执行)，返回词条数"""
+    if USE_GSHEETS:
+        # GSheets 模式没有词频表，词云现场统计
+        return 0
+    # 分词很慢，不能一直占着写锁：先在事务外统计已有帖子，拿到写锁后只补上统计期间
+    # 新提交的帖子 (帖子只追加、正文不修改，按 id 递增续读不会漏也不会重复)
+    counts, last_id = _count_post_tokens(get_connection())
+    with transaction() as c:
+        return _rebuild_word_freq(c, counts, last_id)
+
+def _rebuild_word_freq(c, counts=None, after_id=0):
+    """用 counts (已统计到 after_id 为止) 加上其余帖子的词频替换整张词频表"""
+    counts, _ = _count_post_tokens(c, counts, after_id)
+    c.execute("DELETE FROM word_freq")
+    c.executemany(
+        "INSERT INTO word_freq (role, token, count) VALUES (?, ?, ?)",
+        ((role, token, n) for role, counter in counts.items() for token, n in counter.items())
+    )
+    return sum(len(counter) for counter in counts.values())
+
+def _count_post_tokens(c, counts=None, after_id=0, batch_size=1000):
+    """按 id 分批统计 id > after_id 的帖子词频，累加进 counts，返回 (counts, 最后一条的 id)"""
+    from utils.analysis import tokenize
+
+    counts = counts if counts is not None else {}
+    last_id = after_id
+    while True:
+        rows = c.execute(
+            "SELECT id, role, content FROM posts WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return counts, last_id
+        for _, role, content in rows:
+            counts.setdefault(role, Counter()).update(tokenize(content))
+        last_id = rows[-1][0]
+
+def _add_word_counts(c, role, token_counts):
+    c.executemany('''
+        INSERT INTO word_freq (role, token, count) VALUES (?, ?, ?)
+        ON CONFLICT (role, token) DO UPDATE SET count = count + excluded.count
+    ''', [(role, token, n) for token, n in token_counts.items()])
+
+# --- 情感趋势汇总 ---
+
+# 汇总表的时间粒度 -> 时间桶格式 (SQLite strftime)
+ROLLUP_GRANULARITIES = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+}
+# 汇总表按层级计数的列 (n_<tier>)
+ROLLUP_TIERS = ['extreme_negative', 'mild_negative', 'neutral', 'mild_positive', 'extreme_positive']
+
+def get_sentiment_trend(granularity="day", since=None):
+    """
+    按时间桶汇总的情感趋势，返回 DataFrame：
+    bucket (时间桶起点) / role / posts / valence / arousal (桶内均值) / n_<tier> (各层级帖子数)。
+    SQLite 直接读取增量维护的汇总表，每个时间桶一行，与帖子总数无关。
+    since 为 datetime 时只返回不早于它的时间桶。
+    """
+    fmt = ROLLUP_GRANULARITIES[granularity]
+    tier_columns = [f"n_{tier}" for tier in ROLLUP_TIERS]
+    columns = ['bucket', 'role', 'posts', 'valence', 'arousal'] + tier_columns
+
+    if USE_GSHEETS:
+        # GSheets 没有汇总表，现场按时间桶聚合已有得分的帖子
+        try:
+            df = _read_sheet()
+        except Exception:
+            return pd.DataFrame(columns=columns)
+        if df.empty or not set(SENTIMENT_COLUMNS) <= set(df.columns):
+            return pd.DataFrame(columns=columns)
+        df = df.dropna(subset=SENTIMENT_COLUMNS)
+        df['bucket'] = df['created_at'].dt.strftime(fmt)
+        if since is not None:
+            df = df[df['bucket'] >= since.strftime(fmt)]
+        for tier in ROLLUP_TIERS:
+            df[f"n_{tier}"] = (df['tier'] == tier).astype(int)
+        trend = df.groupby(['bucket', 'role'], as_index=False).agg(
+            posts=('tier', 'size'),
+            valence=('valence', lambda v: pd.to_numeric(v).mean()),
+            arousal=('arousal', lambda v: pd.to_numeric(v).mean()),
+            **{col: (col, 'sum') for col in tier_columns}
+        )
     else:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("UPDATE posts SET likes = MAX(0, likes - 1) WHERE id = ?", (post_id,))
-        conn.commit()
-        conn.close()
+        sql = f'''
+            SELECT bucket, role, posts, valence_sum / posts AS valence, arousal_sum / posts AS arousal,
+                   {", ".join(tier_columns)}
+            FROM sentiment_rollup WHERE granularity = ?
+        '''
+        params = [granularity]
+        if since is not None:
+            sql += " AND bucket >= ?"
+            params.append(since.strftime(fmt))
+        try:
+            trend = pd.read_sql_query(sql, get_connection(), params=params)
+        except:
+            return pd.DataFrame(columns=columns)
+
+    trend['bucket'] = pd.to_datetime(trend['bucket'])
+    return trend.sort_values(['bucket', 'role'], ignore_index=True)[columns]
+
+def sentiment_trend_snapshot(granularity="day"):
+    """get_sentiment_trend 的共享快照 (只读)"""
+    return _sentiment_trend_snapshot(_data_version, DB_FILE, granularity)
+
+@st.cache_resource(max_entries=len(ROLLUP_GRANULARITIES), show_spinner=False)
+def _sentiment_trend_snapshot(version, db_file, granularity):
+    return get_sentiment_trend(granularity)
+
+def rebuild_sentiment_rollup():
+    """按帖子表全量重建情感汇总表 (修改打分规则并回填后执行)，返回汇总行数"""
+    if USE_GSHEETS:
+        # GSheets 模式没有汇总表，趋势图现场聚合
+        return 0
+    with transaction() as c:
+        return _rebuild_sentiment_rollup(c)
+
+def _rebuild_sentiment_rollup(c):
+    tier_columns = ", ".join(f"n_{tier}" for tier in ROLLUP_TIERS)
+    tier_counts = ", ".join(f"SUM(tier = '{tier}')" for tier in ROLLUP_TIERS)
+    c.execute("DELETE FROM sentiment_rollup")
+    for granularity, fmt in ROLLUP_GRANULARITIES.items():
+        # 还没有得分的历史帖子不计入，回填时再增量加入
+        c.execute(f'''
+            INSERT INTO sentiment_rollup (granularity, bucket, role, posts, valence_sum, arousal_sum, {tier_columns})
+            SELECT ?, strftime(?, created_at) AS bucket, role, COUNT(*), SUM(valence), SUM(arousal), {tier_counts}
+            FROM posts
+            WHERE valence IS NOT NULL AND arousal IS NOT NULL AND tier IS NOT NULL
+            GROUP BY bucket, role
+        ''', (granularity, fmt))
+    return c.execute("SELECT COUNT(*) FROM sentiment_rollup").fetchone()[0]
+
+def _add_to_rollup(c, rows):
+    """把新打分的帖子 [(role, created_at, valence, arousal, tier), ...] 累加进各粒度的时间桶"""
+    tier_columns = [f"n_{tier}" for tier in ROLLUP_TIERS]
+    c.executemany(f'''
+        INSERT INTO sentiment_rollup (granularity, bucket, role, posts, valence_sum, arousal_sum, {", ".join(tier_columns)})
+        VALUES (?, strftime(?, ?), ?, 1, ?, ?, {", ".join("?" * len(tier_columns))})
+        ON CONFLICT (granularity, bucket, role) DO UPDATE SET
+            posts = posts + 1,
+            valence_sum = valence_sum + excluded.valence_sum,
+            arousal_sum = arousal_sum + excluded.arousal_sum,
+            {", ".join(f"{col} = {col} + excluded.{col}" for col in tier_columns)}
+    ''', [
+        (granularity, fmt, created_at, role, valence, arousal, *(int(tier == t) for t in ROLLUP_TIERS))
+        for role, created_at, valence, arousal, tier in rows
+        for granularity, fmt in ROLLUP_GRANULARITIES.items()
+    ])
 
 # --- 评论相关功能 ---
 
 def get_comments(post_id):
     """获取指定帖子的所有评论"""
     post_id = str(post_id)
+    return get_comments_bulk([post_id]).get(post_id, pd.DataFrame(columns=COMMENT_COLUMNS))
+
+def get_comments_bulk(post_ids):
+    """
+    批量获取多个帖子的评论 (一次查询 / 一次读表)。
+    返回 {post_id: DataFrame}，没有评论的帖子不出现在结果中。
+    """
+    post_ids = [str(pid) for pid in post_ids]
+    if not post_ids:
+        return {}
+
     if USE_GSHEETS:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        try:
-            # 假设评论存在名为 'comments' 的 worksheet 中
-            # 注意：Streamlit GSheet 连接器默认读第一个 sheet，读其他 sheet 需要指定 worksheet 参数
-            df = conn.read(worksheet="comments", ttl=0)
-            if not df.empty:
-                df['post_id'] = df['post_id'].astype(str)
-                # 筛选当前帖子的评论
-                df = df[df['post_id'] == post_id]
-                df = df.sort_values(by='created_at', ascending=True)
-                return df
-        except Exception:
-            # 如果 worksheet 不存在或报错
-            return pd.DataFrame(columns=['id', 'post_id', 'role', 'nickname', 'content', 'created_at'])
-        return pd.DataFrame()
+        df = _read_comments_sheet()
+        if df.empty:
+            return {}
+        df = df[df['post_id'].isin(post_ids)]
     else:
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         try:
-            df = pd.read_sql_query("SELECT * FROM comments WHERE post_id = ? ORDER BY created_at ASC", conn, params=(post_id,))
+            frames = []
+            for chunk in _chunked(post_ids):
+                placeholders = ",".join("?" * len(chunk))
+                frames.append(pd.read_sql_query(
+                    f"SELECT * FROM comments WHERE post_id IN ({placeholders}) ORDER BY created_at ASC",
+                    conn, params=[int(pid) for pid in chunk]
+                ))
+            df = pd.concat(frames, ignore_index=True)
         except:
-            df = pd.DataFrame()
-        finally:
-            conn.close()
-        return df
+            return {}
+        if df.empty:
+            return {}
+        df['post_id'] = df['post_id'].astype(str)
+
+    df = df.sort_values(by='created_at', ascending=True)
+    return {pid: group for pid, group in df.groupby('post_id', sort=False)}
+
+def get_comment_counts(post_ids):
+    """
+    批量统计多个帖子的评论数 (一次查询 / 一次读表)。
+    返回 {post_id: count}，没有评论的帖子计为 0。
+    """
+    post_ids = [str(pid) for pid in post_ids]
+    counts = dict.fromkeys(post_ids, 0)
+    if not post_ids:
+        return counts
+
+    if USE_GSHEETS:
+        df = _read_comments_sheet()
+        if not df.empty:
+            hits = df[df['post_id'].isin(post_ids)]['post_id'].value_counts()
+            counts.update({pid: int(n) for pid, n in hits.items()})
+    else:
+        try:
+            c = get_connection().cursor()
+            for chunk in _chunked(post_ids):
+                placeholders = ",".join("?" * len(chunk))
+                c.execute(
+                    f"SELECT post_id, COUNT(*) FROM comments WHERE post_id IN ({placeholders}) GROUP BY post_id",
+                    [int(pid) for pid in chunk]
+                )
+                counts.update({str(pid): n for pid, n in c.fetchall()})
+        except sqlite3.Error:
+            pass
+    return counts
+
+def _read_comments_sheet():
+    """读取整张 comments worksheet (GSheets 模式)，post_id 统一为字符串"""
+    try:
+        return _read_sheet("comments")
+    except Exception:
+        # 如果 worksheet 不存在或报错
+        return pd.DataFrame(columns=COMMENT_COLUMNS)
+
+def _chunked(items, size=SQLITE_MAX_PARAMS):
+    """按 SQLite 参数上限切分 IN (...) 列表"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 def add_comment(post_id, role, nickname, content):
-    """新增评论"""
+    """新增评论，返回新评论的 id"""
     new_data = {
-        "id": str(int(datetime.now().timestamp() * 1000)),
+        "id": _new_sheet_id(),
         "post_id": str(post_id),
         "role": role,
         "nickname": nickname,
@@ -208,20 +1274,53 @@ def add_comment(post_id, role, nickname, content):
     }
     
     if USE_GSHEETS:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        try:
-            df = conn.read(worksheet="comments", ttl=0)
-        except:
-            df = pd.DataFrame(columns=['id', 'post_id', 'role', 'nickname', 'content', 'created_at'])
-            
-        updated_df = pd.concat([df, pd.DataFrame([new_data])], ignore_index=True)
-        conn.update(worksheet="comments", data=updated_df)
+        # 只追加一行，不再整表读出再写回
+        sheets.get_sheets().append_row("comments", new_data)
+        _sheet_written("comments")
+        return new_data["id"]
     else:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute('''
+        def op(c):
+            c.execute('''
+                INSERT INTO comments (post_id, role, nickname, content, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (int(post_id), role, nickname, content, datetime.now()))
+            return c.lastrowid
+        return submit_write(op).result()
+# --- 批量导入 ---
+
+def bulk_insert(posts, comments=(), word_counts=None):
+    """
+    批量导入帖子与评论 (测试数据生成器使用，仅支持 SQLite)，返回 (帖子数, 评论数)。
+    全部数据在同一个事务里用 executemany 写入，并同步更新词频表和情感汇总表。
+
+    posts: [(role, nickname, title, content, is_hidden, created_at, likes, valence, arousal, tier), ...]
+    comments: [(帖子在 posts 中的下标, role, nickname, content, created_at), ...]
+    word_counts: {role: Counter}，调用方已统计好的词频；省略时逐条分词统计。
+    """
+    if USE_GSHEETS:
+        raise RuntimeError("批量导入只支持 SQLite 模式")
+
+    if word_counts is None:
+        from utils.analysis import tokenize
+        word_counts = {}
+        for post in posts:
+            word_counts.setdefault(post[0], Counter()).update(tokenize(post[3]))
+
+    with transaction() as c:
+        # 显式分配 id，评论才能按下标关联到对应的帖子
+        first_id = c.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM posts").fetchone()[0]
+        c.executemany('''
+            INSERT INTO posts (id, role, nickname, title, content, is_hidden, created_at, likes, valence, arousal, tier)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', ((first_id + i, *post) for i, post in enumerate(posts)))
+        c.executemany('''
             INSERT INTO comments (post_id, role, nickname, content, created_at)
             VALUES (?, ?, ?, ?, ?)
-        ''', (post_id, role, nickname, content, datetime.now()))
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        ''', ((first_id + index, *comment) for index, *comment in comments))
+        for role, counts in word_counts.items():
+            _add_word_counts(c, role, counts)
+        _rebuild_sentiment_rollup(c)
+    return len(posts), len(comments)
+
+# 计时：transaction / get_connection 是每次查询都要经过的底层工具，不单独计时
+perf.instrument(globals(), "db", exclude=("transaction", "get_connection"))
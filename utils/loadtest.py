@@ -0,0 +1,243 @@
+"""
+多会话并发压测：用 Streamlit 的 AppTest 无界面地驱动真实页面，在项目根目录执行：
+
+    python -m utils.loadtest --sessions 8 --actions 30
+    python -m utils.loadtest --backend fakesheets --mix browse=4,like=4,comment=1,dashboard=1
+
+每个模拟会话运行 main.py，先点击身份选择页的按钮登录 (_login_action)，再按 --mix
+给出的权重随机执行动作：
+    browse     重新浏览广场 / 加载更多
+    like       点赞或取消点赞某条帖子
+    comment    展开某条帖子的评论区并发表评论
+    dashboard  切到科研看板再切回广场
+
+AppTest 每次运行都会替换进程内唯一的 Streamlit Runtime，不能在线程里并发使用，
+所以每个会话是一个独立进程，共同读写同一个 SQLite 文件 (写锁争用是真实的)。
+fakesheets 后端的假表只存在于进程内存中，各会话各自装入同一份语料，彼此看不到对方的写入。
+
+报告各类动作的 rerun 耗时分布 (p50 / p95 / p99 / max)、总吞吐，以及写线程等待
+SQLite 写锁的时间 (见 db.write_stats)。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+DEFAULT_MIX = {"browse": 4, "like": 4, "comment": 1, "dashboard": 1}
+
+def run(sessions=4, actions=20, mix=None, backend="sqlite", db_file=None, seed_posts=200,
+        comments=1, think=0.0, seed=0, timeout=120):
+    """启动 sessions 个会话进程并发执行，返回汇总报告 (dict)"""
+    mix = mix or DEFAULT_MIX
+    with tempfile.TemporaryDirectory(prefix="heartbridge-load-") as tmp:
+        if backend == "sqlite" and db_file is None:
+            db_file = os.path.join(tmp, "loadtest.db")
+            _seed_sqlite(db_file, seed_posts, comments, seed)
+
+        os.environ["HEARTBRIDGE_BACKEND"] = "fakesheets" if backend == "fakesheets" else ""
+        args = [(i, actions, mix, backend, db_file, seed_posts, comments, think, seed, timeout)
+                for i in range(sessions)]
+        start = time.perf_counter()
+        # spawn：子进程重新导入 utils，读取上面设置的后端环境变量
+        with ProcessPoolExecutor(max_workers=sessions, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_session, args))
+        elapsed = time.perf_counter() - start
+    return _report(results, elapsed, sessions, backend)
+
+def _seed_sqlite(db_file, posts, comments, seed):
+    from utils import db, seed_data
+    db.DB_FILE = db_file
+    db.migrate()
+    db.bulk_insert(*seed_data.generate(posts, comments, seed=seed))
+    db.close_connections()
+
+def _seed_fakesheets(posts, comments, seed):
+    """把合成语料整表写进本进程的假表 (id 按 GSheets 模式的字符串 id 编排)"""
+    import pandas as pd
+    from utils import db, seed_data, sheets
+
+    post_rows, comment_rows, _ = seed_data.generate(posts, comments, seed=seed)
+    df_posts = pd.DataFrame(post_rows, columns=[c for c in db.POST_COLUMNS if c != 'id'])
+    df_posts.insert(0, 'id', [str(i + 1) for i in range(len(df_posts))])
+    df_comments = pd.DataFrame(comment_rows, columns=['post_id', 'role', 'nickname', 'content', 'created_at'])
+    df_comments['post_id'] = (df_comments['post_id'] + 1).astype(str)
+    df_comments.insert(0, 'id', [str(i + 1) for i in range(len(df_comments))])
+    service = sheets.get_sheets()
+    service.write_all(None, df_posts)
+    service.write_all("comments", df_comments[db.COMMENT_COLUMNS])
+
+def _session(args):
+    """单个会话进程：登录后按权重随机执行动作，返回 (各动作耗时, 异常信息, 写入统计)"""
+    index, actions, mix, backend, db_file, seed_posts, comments, think, seed, timeout = args
+    from streamlit.testing.v1 import AppTest
+    from utils import db
+
+    if backend == "sqlite":
+        db.DB_FILE = db_file
+    else:
+        _seed_fakesheets(seed_posts, comments, seed)
+
+    rng = random.Random(seed * 1000 + index)
+    timings = {}
+    errors = []
+
+    def timed(name, step):
+        start = time.perf_counter()
+        at = step()
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+        if at is not None and len(at.exception):
+            errors.append(f"{name}: {at.exception[0].message}")
+
+    at = AppTest.from_file(MAIN_SCRIPT, default_timeout=timeout)
+    timed("open", at.run)
+    timed("login", at.button(key="btn_parent" if index % 2 else "btn_child").click().run)
+
+    names, weights = list(mix), list(mix.values())
+    for _ in range(actions):
+        action = rng.choices(names, weights)[0]
+        step = _ACTIONS[action](at, rng)
+        if step is not None:
+            timed(action, step)
+        if think:
+            time.sleep(think)
+
+    db.flush_writes()
+    stats = db.write_stats()
+    if backend == "fakesheets":
+        from utils import sheets
+        stats.update({f"sheets_{k}": v for k, v in sheets.get_sheets().stats.items()})
+    return timings, errors, stats
+
+def _browse(at, rng):
+    more = [b for b in at.button if b.key and b.key.startswith("load_more_")]
+    if more and rng.random() < 0.5:
+        return rng.choice(more).click().run
+    return at.run
+
+def _like(at, rng):
+    likes = [b for b in at.button if b.key and b.key.startswith("like_")]
+    if not likes:
+        return None
+    return rng.choice(likes).click().run
+
+def _comment(at, rng):
+    likes = [b for b in at.button if b.key and b.key.startswith("like_")]
+    if not likes:
+        return None
+    post_id = rng.choice(likes).key[len("like_"):]
+
+    def step():
+        # AppTest 不回传展开状态，每次运行前都要重新标记评论区为展开
+        at.session_state[f"comments_{post_id}"] = True
+        at.run()
+        form = f"comment_form_{post_id}"
+        box = [t for t in at.text_input if t.form_id == form]
+        if not box:
+            return at
+        box[0].input(f"压测评论 {rng.randint(0, 10**6)}")
+        at.session_state[f"comments_{post_id}"] = True
+        return [b for b in at.button if b.form_id == form][0].click().run()
+    return step
+
+def _dashboard(at, rng):
+    def step():
+        at.sidebar.radio[0].set_value("科研看板").run()
+        return at.sidebar.radio[0].set_value("问答广场").run()
+    return step
+
+_ACTIONS = {"browse": _browse, "like": _like, "comment": _comment, "dashboard": _dashboard}
+
+def _report(results, elapsed, sessions, backend):
+    latencies = {}
+    errors = []
+    write = {}
+    for timings, session_errors, stats in results:
+        for name, values in timings.items():
+            latencies.setdefault(name, []).extend(values)
+        errors.extend(session_errors)
+        for key, value in stats.items():
+            write[key] = max(write.get(key, 0), value) if key.startswith("max_") else write.get(key, 0) + value
+
+    actions = {}
+    for name, values in latencies.items():
+        ms = np.array(values) * 1000
+        actions[name] = {
+            "count": len(values),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+        }
+    total = sum(a["count"] for a in actions.values())
+    return {
+        "backend": backend,
+        "sessions": sessions,
+        "elapsed_s": elapsed,
+        "reruns": total,
+        "reruns_per_s": total / elapsed if elapsed else 0.0,
+        "actions": actions,
+        "write": write,
+        "errors": errors,
+    }
+
+def _print_report(report):
+    print(f"🧪 {report['sessions']} 个会话 ({report['backend']})，共 {report['reruns']} 次运行，"
+          f"用时 {report['elapsed_s']:.1f}s，{report['reruns_per_s']:.1f} 次/秒")
+    print(f"   {'动作':<10} {'次数':>6} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}")
+    for name, a in report["actions"].items():
+        print(f"   {name:<10} {a['count']:>6} {a['p50_ms']:8.1f}ms {a['p95_ms']:8.1f}ms "
+              f"{a['p99_ms']:8.1f}ms {a['max_ms']:8.1f}ms")
+    w = report["write"]
+    if w.get("commits"):
+        print(f"🔒 写入: {w['commits']} 次提交 / {w['ops']} 个写操作，失败 {w['failed_commits']} 次；"
+              f"等待写锁共 {w['lock_wait_s'] * 1000:.1f}ms (单次最长 {w['max_lock_wait_s'] * 1000:.1f}ms)，"
+              f"平均排队 {w['queue_wait_s'] / w['ops'] * 1000:.2f}ms")
+    if w.get("sheets_read"):
+        print(f"📄 假表: 整表读取 {w['sheets_read']} 次，追加行 {w['sheets_append_row']} 次，"
+              f"改单元格 {w['sheets_add_to_cell']} 次")
+    if report["errors"]:
+        print(f"❌ {len(report['errors'])} 次运行出现异常，例如: {report['errors'][0]}")
+
+def _parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in _ACTIONS:
+            raise argparse.ArgumentTypeError(f"未知的动作: {name} (可选: {', '.join(_ACTIONS)})")
+        mix[name] = float(weight)
+    return mix
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.loadtest", description="心桥多会话并发压测")
+    parser.add_argument("--sessions", type=int, default=4, help="并发会话数 (默认: %(default)s)")
+    parser.add_argument("--actions", type=int, default=20, help="每个会话登录后执行的动作数 (默认: %(default)s)")
+    parser.add_argument("--mix", type=_parse_mix, default=None,
+                        help="动作权重，如 browse=4,like=4,comment=1,dashboard=1")
+    parser.add_argument("--backend", choices=["sqlite", "fakesheets"], default="sqlite", help="存储后端")
+    parser.add_argument("--db", default=None, help="压测使用的 SQLite 文件 (默认在临时目录新建并填充语料)")
+    parser.add_argument("--posts", type=int, default=200, help="新建语料的帖子数 (默认: %(default)s)")
+    parser.add_argument("--comments", type=int, default=1, help="新建语料每条帖子的评论数 (默认: %(default)s)")
+    parser.add_argument("--think", type=float, default=0.0, help="两次动作之间的停顿秒数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子 (默认: %(default)s)")
+    parser.add_argument("--output", default=None, help="报告写入的 JSON 文件")
+    args = parser.parse_args(argv)
+
+    report = run(args.sessions, args.actions, mix=args.mix, backend=args.backend, db_file=args.db,
+                 seed_posts=args.posts, comments=args.comments, think=args.think, seed=args.seed)
+    _print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 报告已写入 {args.output}")
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+数据维护命令，在项目根目录执行：
+
+    python -m utils.maintenance backfill-sentiment   # 为历史帖子补算情感得分
+    python -m utils.maintenance rebuild-word-freq    # 全量重建词云使用的词频表
+    python -m utils.maintenance rebuild-sentiment-rollup  # 全量重建情绪趋势使用的汇总表
+"""
+import argparse
+import time
+
+from utils import db
+
+def backfill_sentiment(args):
+    count = db.backfill_sentiment(batch_size=args.batch_size)
+    print(f"✅ 已为 {count} 条帖子补算情感得分。")
+
+def rebuild_word_freq(args):
+    count = db.rebuild_word_freq()
+    print(f"✅ 词频表已重建，共 {count} 个词条。")
+
+def rebuild_sentiment_rollup(args):
+    count = db.rebuild_sentiment_rollup()
+    print(f"✅ 情感汇总表已重建，共 {count} 个时间桶。")
+
+COMMANDS = {
+    "backfill-sentiment": (backfill_sentiment, "为还没有情感得分的帖子补算并保存得分"),
+    "rebuild-word-freq": (rebuild_word_freq, "按现有帖子全量重建词频表"),
+    "rebuild-sentiment-rollup": (rebuild_sentiment_rollup, "按现有帖子全量重建情感汇总表"),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m utils.maintenance", description="心桥数据维护命令")
+    parser.add_argument("--db", default=db.DB_FILE, help="SQLite 数据库路径 (默认: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批处理的帖子数")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        sub.add_parser(name, help=help_text)
+    args = parser.parse_args(argv)
+
+    db.DB_FILE = args.db
+    db.init_db()
+    start = time.perf_counter()
+    COMMANDS[args.command][0](args)
+    print(f"⏱️ 用时 {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
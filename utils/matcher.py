@@ -0,0 +1,66 @@
+from collections import deque
+
+class LexiconMatcher:
+    """
+    Aho-Corasick 多模式匹配器。
+
+    把多个带标签的词库编译成一个自动机，对一段文本只扫描一遍，
+    返回命中的所有标签 (例如 {'extreme_negative', 'high_arousal'})。
+    匹配耗时只与文本长度线性相关，与词库大小无关。
+
+    用法：
+        matcher = LexiconMatcher({"positive": ["开心", "快乐"], "negative": ["难过"]})
+        matcher.match("今天很开心")  # -> frozenset({'positive'})
+    """
+
+    def __init__(self, lexicons):
+        # 状态 0 为根节点；每个状态：字符转移表、失败指针、到达该状态时命中的标签
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+
+        for label, words in lexicons.items():
+            for word in words:
+                if word:
+                    self._add(word, label)
+        self._build()
+
+    def _add(self, word, label):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state].add(label)
+
+    def _build(self):
+        # 广度优先计算失败指针，并把失败链上的标签并入当前状态，匹配时无需再沿链回溯
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+                pending.append(nxt)
+        self._out = [frozenset(labels) for labels in self._out]
+
+    def match(self, text):
+        """扫描一遍文本，返回命中的标签集合 (frozenset)"""
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits |= out[state]
+        return frozenset(hits)
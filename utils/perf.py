@@ -0,0 +1,168 @@
+"""
+热点路径耗时记录。
+
+db.py / analysis.py 末尾调用 instrument() 给模块内全部公开函数套上计时；视图里的渲染
+阶段用 span() 包起来。每次计时 (一个 span) 同时记入两处：
+    本次 rerun 的明细    begin_rerun() / end_rerun() 之间、同一脚本线程里发生的 span，
+                          供侧边栏的性能面板展示
+    进程内的累计直方图    按 span 名称分桶计数，render_prometheus() 输出 Prometheus 文本格式
+
+默认不记录：只有打开了性能面板的会话在其 rerun 期间记录 (按脚本线程区分)，
+其余调用只多一次属性判断。设置环境变量 HEARTBRIDGE_PERF=1 则整个进程始终记录
+(包括后台写线程)，便于长期采集直方图。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+ALWAYS_ON = os.environ.get("HEARTBRIDGE_PERF", "") not in ("", "0")
+# 直方图分桶上界 (秒)，与 Prometheus 客户端的默认分桶一致
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+# 单次 rerun 最多保留的明细条数 (逐条分词这类高频调用只计入汇总)
+MAX_SPANS = 300
+
+class _Local(threading.local):
+    # None 表示当前线程不在记录中的 rerun 里
+    rerun = None
+    depth = 0
+
+_local = _Local()
+_histograms = {}
+_lock = threading.Lock()
+
+class _Rerun:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []      # [(名称, 嵌套深度, 相对 rerun 开始的秒数, 耗时秒数), ...]
+        self.totals = {}     # 名称 -> [调用次数, 总耗时]
+        self.dropped = 0
+
+def enabled():
+    """当前线程是否在记录"""
+    return ALWAYS_ON or _local.rerun is not None
+
+def begin_rerun(record=True):
+    """脚本开始执行时调用；record 为 False 时本次 rerun 不记录 (除非 ALWAYS_ON)"""
+    _local.rerun = _Rerun() if record else None
+    _local.depth = 0
+
+def end_rerun():
+    """结束本次 rerun 的记录，返回 _Rerun (没有在记录时返回 None)"""
+    rerun = _local.rerun
+    _local.rerun = None
+    if rerun is not None:
+        _observe("rerun", time.perf_counter() - rerun.start)
+    return rerun
+
+@contextmanager
+def span(name):
+    """记录代码块的耗时"""
+    if not (ALWAYS_ON or _local.rerun is not None):
+        yield
+        return
+    start = _enter()
+    try:
+        yield
+    finally:
+        _exit(name, start)
+
+def timed(name):
+    """函数装饰器版的 span()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not (ALWAYS_ON or _local.rerun is not None):
+                return fn(*args, **kwargs)
+            start = _enter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _exit(name, start)
+        return wrapper
+    return decorator
+
+def instrument(namespace, prefix, exclude=()):
+    """
+    给模块命名空间 (globals()) 里在该模块中定义的公开函数套上 timed()，span 名称为 “prefix.函数名”。
+    放在模块末尾调用；模块内部互相调用同样经过 globals 查找，也会被记录。
+    """
+    module = namespace["__name__"]
+    for name, fn in list(namespace.items()):
+        if (name.startswith("_") or name in exclude or not callable(fn) or isinstance(fn, type)
+                or getattr(fn, "__module__", None) != module):
+            continue
+        namespace[name] = timed(f"{prefix}.{name}")(fn)
+
+def _enter():
+    _local.depth += 1
+    return time.perf_counter()
+
+def _exit(name, start):
+    elapsed = time.perf_counter() - start
+    _local.depth -= 1
+    rerun = _local.rerun
+    if rerun is not None:
+        total = rerun.totals.setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += elapsed
+        if len(rerun.spans) < MAX_SPANS:
+            rerun.spans.append((name, _local.depth, start - rerun.start, elapsed))
+        else:
+            rerun.dropped += 1
+    _observe(name, elapsed)
+
+def _observe(name, elapsed):
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            # [各分桶计数 (最后一个是 +Inf), 总耗时, 最大耗时]
+            hist = _histograms[name] = [[0] * (len(BUCKETS) + 1), 0.0, 0.0]
+        i = 0
+        while i < len(BUCKETS) and elapsed > BUCKETS[i]:
+            i += 1
+        hist[0][i] += 1
+        hist[1] += elapsed
+        hist[2] = max(hist[2], elapsed)
+
+def summary():
+    """累计直方图的汇总：[(名称, 调用次数, 总秒数, 平均秒数, p95 的上界估计, 最大秒数), ...]，按总耗时降序"""
+    with _lock:
+        items = [(name, list(counts), total, peak) for name, (counts, total, peak) in _histograms.items()]
+    rows = []
+    for name, counts, total, peak in items:
+        n = sum(counts)
+        rows.append((name, n, total, total / n, _bucket_quantile(counts, n, 0.95, peak), peak))
+    return sorted(rows, key=lambda r: r[2], reverse=True)
+
+def _bucket_quantile(counts, n, q, peak):
+    seen = 0
+    for bound, count in zip(BUCKETS, counts):
+        seen += count
+        if seen >= q * n:
+            return min(bound, peak)
+    return peak
+
+def reset():
+    """清空累计直方图"""
+    with _lock:
+        _histograms.clear()
+
+def render_prometheus():
+    """以 Prometheus 文本格式输出累计直方图"""
+    with _lock:
+        items = sorted((name, list(counts), total) for name, (counts, total, _) in _histograms.items())
+    lines = [
+        "# HELP heartbridge_span_seconds Time spent in instrumented functions and page sections.",
+        "# TYPE heartbridge_span_seconds histogram",
+    ]
+    for name, counts, total in items:
+        cumulative = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'heartbridge_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'heartbridge_span_seconds_sum{{span="{name}"}} {total}')
+        lines.append(f'heartbridge_span_seconds_count{{span="{name}"}} {cumulative}')
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,21 @@
-import sqlite3
+"""
+测试数据注入。在项目根目录执行：
+
+    python -m utils.seed_data            # 注入 8 条情感特征鲜明的手写帖子 (会先确认)
+    python -m utils.seed_data generate --posts 100000 --comments 2
+                                         # 批量生成合成语料，用于压测 (不需要确认)
+
+generate 的常用参数：--parent-ratio 家长帖子占比、--tiers 各情绪层级占比、
+--days 发帖时间分布在最近多少天内、--seed 随机种子。运行 --help 查看全部参数。
+"""
+import argparse
+import time
+from collections import Counter
 from datetime import datetime
 import random
 
+import numpy as np
+
 DB_FILE = 'heartbridge.db'
 
 # 测试数据集：旨在覆盖极端情绪，验证 NLP 分析的敏感度
@@ -46,25 +60,182 @@ TEST_DATA = [
 ]
 
 def seed_database():
+    """
+    把 TEST_DATA 经 db.bulk_insert 写入当前数据库：与发帖一样保存情感得分，
+    并同步更新词频表、情感汇总表和数据版本号，看板无需再执行维护命令。
+    """
+    from utils import db
+    from utils.analysis import score_texts
+
     print("🚀 开始注入测试数据...")
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    for post in TEST_DATA:
+    db.init_db()
+    scores = score_texts([post['content'] for post in TEST_DATA])
+    now = str(datetime.now())
+    rows = [
         # 随机生成一些点赞数
-        likes = random.randint(0, 50)
-        c.execute('''
-            INSERT INTO posts (role, nickname, title, content, is_hidden, created_at, likes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (post['role'], post['nickname'], post['title'], post['content'], False, datetime.now(), likes))
-    
-    conn.commit()
-    conn.close()
-    print(f"✅ 成功注入 {len(TEST_DATA)} 条具有鲜明情感特征的测试数据。")
+        (post['role'], post['nickname'], post['title'], post['content'], False, now, random.randint(0, 50), *score)
+        for post, score in zip(TEST_DATA, scores)
+    ]
+    n_posts, _ = db.bulk_insert(rows)
+    print(f"✅ 成功注入 {n_posts} 条具有鲜明情感特征的测试数据。")
+
+# --- 合成语料生成器 ---
+
+# 默认的情绪层级分布 (与 analysis.VALENCE_TIERS / NEUTRAL_TIER 的层级名对应)
+DEFAULT_TIER_MIX = {
+    "extreme_negative": 0.1,
+    "mild_negative": 0.25,
+    "neutral": 0.3,
+    "mild_positive": 0.25,
+    "extreme_positive": 0.1,
+}
+# 每个 (角色, 层级) 预先生成并打分的正文条数，帖子从中抽取
+CONTENT_POOL_SIZE = 64
+# 昵称 / 标题 / 评论的候选池大小
+TEXT_POOL_SIZE = 500
+ROLES = ["家长", "孩子"]
+
+def generate(posts, comments_per_post=0, parent_ratio=0.5, tier_mix=None, days=30, seed=None):
+    """
+    生成合成语料，返回可直接交给 db.bulk_insert 的 (posts, comments, word_counts)。
+
+    正文由 faker 生成的填充句加上目标层级词库中的词语拼成。每个 (角色, 层级) 只生成
+    CONTENT_POOL_SIZE 条不同的正文，并各自真实打分 / 分词一次，帖子再从中抽取，
+    因此百万级数据也只需几秒，且存下的得分与应用现场计算的一致。
+    """
+    from faker import Faker
+    from utils.analysis import VALENCE_TIERS, high_arousal, low_arousal, score_text, tokenize
+    from utils.nickname import generate_nickname
+
+    tier_mix = tier_mix or DEFAULT_TIER_MIX
+    tiers = list(tier_mix)
+    weights = np.array([tier_mix[t] for t in tiers], dtype=float)
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    fake = Faker("zh_CN")
+    Faker.seed(seed)
+
+    lexicons = {name: words for name, words, _ in VALENCE_TIERS}
+    unknown = set(tiers) - set(lexicons) - {"neutral"}
+    if unknown:
+        raise ValueError(f"未知的情绪层级: {sorted(unknown)}")
+    # 唤醒度词语只用不在效价词库里的，避免改变目标层级
+    valence_words = {w for words in lexicons.values() for w in words}
+    arousal_words = [w for w in high_arousal + low_arousal if w not in valence_words]
+
+    # 1. 正文池：每条真实打分、分词一次
+    pool = {}
+    for role in ROLES:
+        for tier in tiers:
+            entries = []
+            for _ in range(CONTENT_POOL_SIZE):
+                parts = [fake.sentence()]
+                if tier != "neutral":
+                    parts.append(random.choice(lexicons[tier]))
+                if random.random() < 0.3:
+                    parts.append(random.choice(arousal_words))
+                parts.append(fake.sentence())
+                content = "".join(parts)
+                entries.append((content, score_text(content), Counter(tokenize(content))))
+            pool[role, tier] = entries
+
+    nicknames = {role: [generate_nickname(role) for _ in range(TEXT_POOL_SIZE)] for role in ROLES}
+    titles = [fake.sentence(nb_words=4).rstrip(".") for _ in range(TEXT_POOL_SIZE)]
+    replies = [fake.sentence() for _ in range(TEXT_POOL_SIZE)]
+
+    # 2. 帖子：角色 / 层级 / 正文下标 / 时间全部向量化抽样
+    role_idx = (rng.random(posts) >= parent_ratio).astype(int)  # 0: 家长, 1: 孩子
+    tier_idx = rng.choice(len(tiers), size=posts, p=weights / weights.sum())
+    content_idx = rng.integers(CONTENT_POOL_SIZE, size=posts)
+    now = np.datetime64(datetime.now(), "us")
+    offsets = (rng.random(posts) * days * 86400e6).astype("timedelta64[us]")
+    # 按时间先后生成：id 与发帖时间同序，索引也按顺序追加，导入快一倍
+    created = np.sort(now - offsets)
+    likes = rng.integers(0, 50, size=posts)
+    hidden = rng.random(posts) < 0.1
+    nick_idx = rng.integers(TEXT_POOL_SIZE, size=posts)
+    title_idx = rng.integers(TEXT_POOL_SIZE, size=posts)
+
+    post_rows = []
+    word_counts = {role: Counter() for role in ROLES}
+    used = Counter()
+    for i, (r, t, k, ts) in enumerate(zip(role_idx.tolist(), tier_idx.tolist(), content_idx.tolist(),
+                                         np.datetime_as_string(created).tolist())):
+        role = ROLES[r]
+        content, (valence, arousal, tier), _ = pool[role, tiers[t]][k]
+        used[role, tiers[t], k] += 1
+        post_rows.append((role, nicknames[role][nick_idx[i]], titles[title_idx[i]], content,
+                          bool(hidden[i]), ts.replace("T", " "), int(likes[i]), valence, arousal, tier))
+
+    # 词频：每条正文的词频乘以它被抽中的次数
+    for (role, tier, k), n in used.items():
+        for token, count in pool[role, tier][k][2].items():
+            word_counts[role][token] += count * n
+
+    # 3. 评论：每条帖子 comments_per_post 条，时间在发帖后 (平均一小时内)
+    comment_rows = []
+    if comments_per_post:
+        total = posts * comments_per_post
+        post_index = np.repeat(np.arange(posts), comments_per_post)
+        comment_role = rng.integers(2, size=total)
+        delays = rng.exponential(3600e6, size=total).astype("timedelta64[us]")
+        comment_times = np.minimum(created[post_index] + delays, now)
+        comment_nick = rng.integers(TEXT_POOL_SIZE, size=total)
+        reply_idx = rng.integers(TEXT_POOL_SIZE, size=total)
+        for i, (p, r, ts) in enumerate(zip(post_index.tolist(), comment_role.tolist(),
+                                           np.datetime_as_string(comment_times).tolist())):
+            role = ROLES[r]
+            comment_rows.append((p, role, nicknames[role][comment_nick[i]], replies[reply_idx[i]], ts.replace("T", " ")))
+
+    return post_rows, comment_rows, word_counts
+
+def _parse_tier_mix(text):
+    """解析 "extreme_negative=0.1,neutral=0.5,..." 形式的层级分布"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight)
+    if not mix or min(mix.values()) < 0 or sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError(f"无效的层级分布: {text}")
+    return mix
+
+def main(argv=None):
+    global DB_FILE
+    parser = argparse.ArgumentParser(prog="python -m utils.seed_data", description="心桥测试数据注入")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite 数据库路径 (默认: %(default)s)")
+    parser.add_argument("-y", "--yes", action="store_true", help="注入手写测试数据时不再确认")
+    sub = parser.add_subparsers(dest="command")
+    gen = sub.add_parser("generate", help="批量生成合成语料 (单事务 executemany 导入)")
+    gen.add_argument("--posts", type=int, default=1000, help="帖子数 (默认: %(default)s)")
+    gen.add_argument("--comments", type=int, default=0, help="每条帖子的评论数 (默认: %(default)s)")
+    gen.add_argument("--parent-ratio", type=float, default=0.5, help="家长帖子占比 (默认: %(default)s)")
+    gen.add_argument("--tiers", type=_parse_tier_mix, default=None,
+                     help="各情绪层级占比，如 extreme_negative=0.1,neutral=0.6,extreme_positive=0.3")
+    gen.add_argument("--days", type=float, default=30, help="发帖时间均匀分布在最近多少天内 (默认: %(default)s)")
+    gen.add_argument("--seed", type=int, default=None, help="随机种子，相同种子生成相同的数据")
+    args = parser.parse_args(argv)
+
+    from utils import db
+    DB_FILE = db.DB_FILE = args.db
+
+    if args.command != "generate":
+        if args.yes or input("⚠️ 这将向数据库写入测试数据，是否继续？(y/n): ").lower() == 'y':
+            seed_database()
+        else:
+            print("操作已取消。")
+        return
+
+    db.init_db()
+
+    start = time.perf_counter()
+    posts, comments, word_counts = generate(
+        args.posts, args.comments, parent_ratio=args.parent_ratio,
+        tier_mix=args.tiers, days=args.days, seed=args.seed
+    )
+    generated = time.perf_counter()
+    n_posts, n_comments = db.bulk_insert(posts, comments, word_counts)
+    print(f"✅ 已导入 {n_posts} 条帖子、{n_comments} 条评论。")
+    print(f"⏱️ 生成 {generated - start:.2f}s，导入 {time.perf_counter() - generated:.2f}s")
 
 if __name__ == "__main__":
-    choice = input("⚠️ 这将向数据库写入测试数据，是否继续？(y/n): ")
-    if choice.lower() == 'y':
-        seed_database()
-    else:
-        print("操作已取消。")
+    main()
@@ -0,0 +1,81 @@
+"""
+SnowNLP 批量情感打分执行器。
+
+词库未命中的帖子需要 SnowNLP 兜底，它是看板最耗时的部分。这里把一批文本
+分块交给进程池并行计算：每个 worker 启动时加载一次情感模型并常驻复用；
+批量较小时直接在当前进程计算，避免进程间通信反而更慢。
+
+可通过环境变量调整：
+    HEARTBRIDGE_SNOWNLP_WORKERS    进程数 (默认 CPU 核数，设为 1 表示不开进程池)
+    HEARTBRIDGE_SNOWNLP_THRESHOLD  少于多少条时不走进程池 (默认 200)
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils import perf
+
+SNOWNLP_WORKERS = int(os.environ.get("HEARTBRIDGE_SNOWNLP_WORKERS", "0")) or (os.cpu_count() or 1)
+SNOWNLP_PARALLEL_THRESHOLD = int(os.environ.get("HEARTBRIDGE_SNOWNLP_THRESHOLD", "200"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+@perf.timed("sentiment.snownlp_sentiments")
+def snownlp_sentiments(texts):
+    """
+    批量计算 SnowNLP 原始情感概率 (0-1)，计算失败的文本返回 None。
+    """
+    texts = list(texts)
+    if len(texts) < SNOWNLP_PARALLEL_THRESHOLD or SNOWNLP_WORKERS <= 1:
+        return _raw_sentiments(texts)
+
+    # 每个 worker 分到几块，兼顾负载均衡与通信开销
+    size = max(16, -(-len(texts) // (SNOWNLP_WORKERS * 4)))
+    chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+    try:
+        results = []
+        for part in _get_executor().map(_raw_sentiments, chunks):
+            results.extend(part)
+        return results
+    except BrokenProcessPool:
+        # worker 异常退出：丢弃进程池，本次退回当前进程计算
+        shutdown()
+        return _raw_sentiments(texts)
+
+def shutdown():
+    """关闭进程池 (下次调用时会重新创建)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn：Streamlit 进程里有多个线程，fork 出的子进程可能继承到被占用的锁
+            _executor = ProcessPoolExecutor(
+                max_workers=SNOWNLP_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            )
+        return _executor
+
+def _warm_up():
+    """worker 初始化：加载一次 SnowNLP 情感模型，之后的任务直接复用"""
+    from snownlp import SnowNLP
+    SnowNLP("预热").sentiments
+
+def _raw_sentiments(texts):
+    from snownlp import SnowNLP
+    results = []
+    for text in texts:
+        try:
+            results.append(SnowNLP(text).sentiments)
+        except Exception:
+            results.append(None)
+    return results
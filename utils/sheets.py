@@ -0,0 +1,205 @@
+"""
+Google Sheets 表格读写服务。
+
+GSheets 模式原来的写入是“整表读出 → pandas 修改 → 整表写回”，每次写入的开销随表
+的大小增长，多个会话同时写入时后写的会覆盖先写的。这里把写入收窄为：
+    append_row()   新增帖子 / 评论：只在表末尾追加一行
+    add_to_cell()  点赞计数：只读写目标行的一个单元格
+整表写回 (write_all) 只留给回填得分这类维护操作。
+
+GSpreadSheets 通过 streamlit-gsheets 连接器底层的 gspread worksheet 实现这些操作；
+FakeSheets 是进程内的假表服务，设置环境变量 HEARTBRIDGE_BACKEND=fakesheets 后，
+不需要 Google 账号就能离线运行 GSheets 模式的全部代码路径。
+"""
+import os
+import threading
+
+import pandas as pd
+
+BACKEND = os.environ.get("HEARTBRIDGE_BACKEND", "")
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_sheets():
+    """返回当前进程使用的表格服务 (每个进程一个实例)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            if BACKEND == "fakesheets":
+                _service = FakeSheets()
+            else:
+                import streamlit as st
+                from streamlit_gsheets import GSheetsConnection
+                _service = GSpreadSheets(st.connection("gsheets", type=GSheetsConnection))
+        return _service
+
+class GSpreadSheets:
+    """
+    基于 streamlit-gsheets 连接器的表格服务。worksheet 为 None 表示第一个 sheet。
+    表头和 id 所在的行号会缓存下来：应用只追加行、不删除行，行号是稳定的；
+    每次改单元格前都会核对该行的 id，表被人工改动过时重新定位。
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._worksheets = {}
+        self._headers = {}
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def read(self, worksheet=None):
+        if worksheet:
+            return self.conn.read(worksheet=worksheet, ttl=0)
+        return self.conn.read(ttl=0)
+
+    def write_all(self, worksheet, df):
+        if worksheet:
+            self.conn.update(worksheet=worksheet, data=df)
+        else:
+            self.conn.update(data=df)
+        with self._lock:
+            self._headers.pop(worksheet, None)
+            self._rows.pop(worksheet, None)
+
+    def append_row(self, worksheet, row):
+        ws = self._worksheet(worksheet)
+        header = self._header(worksheet, ws, list(row))
+        ws.append_row([_cell(row.get(col)) for col in header], value_input_option="USER_ENTERED")
+
+    def add_to_cell(self, worksheet, key_column, key, column, delta, minimum=None):
+        """
+        把 key_column == key 那一行的 column 单元格加上 delta，返回新值；找不到该行时返回 None。
+        """
+        ws = self._worksheet(worksheet)
+        header = self._header(worksheet, ws, [key_column, column])
+        key_col = header.index(key_column) + 1
+        col = header.index(column) + 1
+
+        key = str(key)
+        row = self._find_row(worksheet, ws, key_col, key)
+        if row is None:
+            return None
+        values = ws.row_values(row)
+        if len(values) < key_col or values[key_col - 1] != key:
+            # 缓存的行号已失效 (表被人工调整过)，重新定位
+            with self._lock:
+                self._rows.pop(worksheet, None)
+            row = self._find_row(worksheet, ws, key_col, key)
+            if row is None:
+                return None
+            values = ws.row_values(row)
+
+        current = values[col - 1] if len(values) >= col else ""
+        value = int(float(current or 0)) + delta
+        if minimum is not None:
+            value = max(minimum, value)
+        ws.update_cell(row, col, value)
+        return value
+
+    def _worksheet(self, worksheet):
+        with self._lock:
+            ws = self._worksheets.get(worksheet)
+        if ws is None:
+            # 复用连接器自己的 spreadsheet / worksheet 解析逻辑
+            ws = self.conn.client._select_worksheet(worksheet=worksheet)
+            with self._lock:
+                self._worksheets[worksheet] = ws
+        return ws
+
+    def _header(self, worksheet, ws, columns):
+        with self._lock:
+            header = self._headers.get(worksheet)
+        if header is None:
+            header = ws.row_values(1)
+        missing = [col for col in columns if col not in header]
+        if missing:
+            # 表头缺少的列补在最后 (例如旧表还没有情感得分列)
+            header = header + missing
+            if len(header) > ws.col_count:
+                ws.add_cols(len(header) - ws.col_count)
+            ws.update("A1", [header])
+        with self._lock:
+            self._headers[worksheet] = header
+        return header
+
+    def _find_row(self, worksheet, ws, key_col, key):
+        with self._lock:
+            rows = self._rows.get(worksheet)
+        if rows is None or key not in rows:
+            # 只读取 id 这一列，而不是整张表
+            rows = {value: i + 1 for i, value in enumerate(ws.col_values(key_col)) if i > 0}
+            with self._lock:
+                self._rows[worksheet] = rows
+        return rows.get(key)
+
+class FakeSheets:
+    """
+    进程内的假表服务，接口与 GSpreadSheets 相同，数据只保存在内存里。
+    stats 记录各操作的调用次数和读写的单元格数，便于核对写入是否与表大小无关。
+    """
+
+    def __init__(self):
+        self._sheets = {}
+        self._lock = threading.Lock()
+        self.stats = {"read": 0, "append_row": 0, "add_to_cell": 0, "write_all": 0,
+                      "cells_read": 0, "cells_written": 0}
+
+    def read(self, worksheet=None):
+        with self._lock:
+            header, rows = self._sheets.get(worksheet, ([], []))
+            self.stats["read"] += 1
+            self.stats["cells_read"] += len(header) * (len(rows) + 1)
+            return pd.DataFrame([list(r) for r in rows], columns=header)
+
+    def write_all(self, worksheet, df):
+        header = [str(col) for col in df.columns]
+        rows = [[_value(v) for v in r] for r in df.itertuples(index=False)]
+        with self._lock:
+            self._sheets[worksheet] = (header, rows)
+            self.stats["write_all"] += 1
+            self.stats["cells_written"] += len(header) * (len(rows) + 1)
+
+    def append_row(self, worksheet, row):
+        with self._lock:
+            header, rows = self._sheets.setdefault(worksheet, ([], []))
+            missing = [col for col in row if col not in header]
+            if missing:
+                header.extend(missing)
+                self.stats["cells_written"] += len(missing)
+                for r in rows:
+                    r.extend([None] * len(missing))
+            rows.append([row.get(col) for col in header])
+            self.stats["append_row"] += 1
+            self.stats["cells_written"] += len(header)
+
+    def add_to_cell(self, worksheet, key_column, key, column, delta, minimum=None):
+        with self._lock:
+            header, rows = self._sheets.get(worksheet, ([], []))
+            if key_column not in header or column not in header:
+                return None
+            key_col, col = header.index(key_column), header.index(column)
+            for r in rows:
+                if str(r[key_col]) == str(key):
+                    value = int(float(r[col] or 0)) + delta
+                    if minimum is not None:
+                        value = max(minimum, value)
+                    r[col] = value
+                    self.stats["add_to_cell"] += 1
+                    self.stats["cells_read"] += 1
+                    self.stats["cells_written"] += 1
+                    return value
+            return None
+
+def _value(v):
+    """DataFrame 里的缺失值 / numpy 标量转成普通 Python 值"""
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return None
+    if isinstance(v, pd.Timestamp):
+        return v.strftime("%Y-%m-%d %H:%M:%S")
+    return v.item() if hasattr(v, "item") else v
+
+def _cell(v):
+    """写入 Google Sheets 的单元格值：缺失值写成空单元格"""
+    v = _value(v)
+    return "" if v is None else v
@@ -0,0 +1,77 @@
+"""
+启动耗时记录。
+
+main.py 最先导入本模块，之后各阶段 (首屏渲染、延迟导入的页面、后台预热) 调用
+mark() / timed() 记录耗时，report() 汇总成一份启动报告打印到服务端日志。
+每个阶段只记录第一次 (即冷启动) 的耗时。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# 进程内第一次导入本模块的时刻，视为启动起点
+_T0 = time.perf_counter()
+
+_timings = {}
+_lock = threading.Lock()
+_reported = False
+_warm_up_started = False
+
+def mark(name):
+    """记录某个阶段距启动起点的时间 (秒)"""
+    with _lock:
+        _timings.setdefault(name, ('since_start', time.perf_counter() - _T0))
+
+@contextmanager
+def timed(name):
+    """记录代码块自身的耗时 (秒)，同名阶段只记录第一次"""
+    if name in _timings:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _timings.setdefault(name, ('duration', time.perf_counter() - start))
+
+def warm_up_in_background():
+    """
+    首屏渲染后，在后台线程预先导入其余页面并加载 jieba 词典 (每个进程一次)，
+    用户登录后进入广场 / 看板时这些开销已经付过了。
+    """
+    global _warm_up_started
+    with _lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    threading.Thread(target=_warm_up, name="heartbridge-warm-up", daemon=True).start()
+
+def _warm_up():
+    try:
+        with timed("后台预热: views.forum"):
+            import views.forum
+        with timed("后台预热: views.dashboard"):
+            import views.dashboard
+        with timed("后台预热: jieba 词典"):
+            from utils.analysis import warm_up
+            warm_up()
+    except Exception as e:
+        print(f"后台预热失败: {e}")
+    log_report()
+
+def report():
+    """返回 [(阶段, 类型, 秒数), ...]，按记录顺序排列"""
+    with _lock:
+        return [(name, kind, seconds) for name, (kind, seconds) in _timings.items()]
+
+def log_report(once=True):
+    """把启动报告打印到服务端日志 (默认每个进程只打印一次)"""
+    global _reported
+    if once and _reported:
+        return
+    _reported = True
+    print("🚀 启动耗时报告:")
+    for name, kind, seconds in report():
+        label = "启动后" if kind == 'since_start' else "耗时"
+        print(f"   {name:<28} {label} {seconds * 1000:8.1f} ms")
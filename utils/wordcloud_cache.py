@@ -0,0 +1,133 @@
+"""
+词云图片缓存。
+
+词云的布局与栅格化很耗时，但只要词频表、配色和尺寸不变，结果就不会变。
+这里按 (词频表, 配色, 尺寸, 字体) 的摘要缓存渲染好的 PNG：进程内存一层
+(所有会话共享)，磁盘一层 (进程重启后仍可命中)，两层都按 LRU 淘汰。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+
+from wordcloud import WordCloud
+
+from utils import perf
+
+# 支持中文的字体文件 (位于项目根目录)
+FONT_FILE = '新青年体-文跃新青年体.ttf'
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_PATH = os.path.join(PROJECT_ROOT, FONT_FILE)
+
+# 磁盘缓存目录，相对路径按项目根目录解析 (与启动时的工作目录无关)
+CACHE_DIR = os.path.join(PROJECT_ROOT, os.environ.get("HEARTBRIDGE_WORDCLOUD_CACHE", ".cache/wordcloud"))
+MAX_MEMORY_ENTRIES = 32
+MAX_DISK_ENTRIES = 256
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+
+class _FontBytes:
+    """
+    只从磁盘读取一次的字体。PIL 接受带 read() 的文件对象作为字体，WordCloud 布局时
+    会按不同字号反复加载字体，这里每次都返回内存中的同一份字节，不再重复读文件。
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._data = f.read()
+
+    def read(self, *args):
+        return self._data
+
+@lru_cache(maxsize=None)
+def _font():
+    return _FontBytes(FONT_PATH)
+
+@perf.timed("wordcloud.render_wordcloud")
+def render_wordcloud(freqs, colormap, width=400, height=300):
+    """
+    渲染词云并返回 PNG 字节；相同输入直接命中缓存，不再重新布局。
+    """
+    key = _digest(freqs, colormap, width, height)
+
+    with _lock:
+        png = _memory.get(key)
+        if png is not None:
+            _memory.move_to_end(key)
+            return png
+
+    png = _read_disk(key)
+    if png is None:
+        png = _render(freqs, colormap, width, height, seed=int(key[:8], 16))
+        _write_disk(key, png)
+
+    with _lock:
+        _memory[key] = png
+        _memory.move_to_end(key)
+        while len(_memory) > MAX_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+    return png
+
+def _digest(freqs, colormap, width, height):
+    payload = json.dumps(
+        [sorted(freqs.items()), colormap, width, height, FONT_FILE],
+        ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _render(freqs, colormap, width, height, seed):
+    wc = WordCloud(
+        width=width,
+        height=height,
+        background_color='white',
+        colormap=colormap,
+        font_path=_font(),
+        # 布局随机种子由摘要决定，同样的输入总是得到同样的图
+        random_state=seed
+    ).generate_from_frequencies(freqs)
+
+    # 修复 numpy 兼容性问题：直接转为 image 对象，不通过 matplotlib
+    buffer = BytesIO()
+    wc.to_image().save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def _path(key):
+    return os.path.join(CACHE_DIR, f"{key}.png")
+
+def _read_disk(key):
+    path = _path(key)
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        # 更新访问时间，磁盘淘汰按它做 LRU
+        os.utime(path)
+        return png
+    except OSError:
+        return None
+
+def _write_disk(key, png):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{_path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(png)
+        os.replace(tmp, _path(key))
+        _evict_disk()
+    except OSError:
+        # 缓存目录不可写 (例如只读部署环境) 时只用内存缓存
+        pass
+
+def _evict_disk():
+    entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith('.png')]
+    if len(entries) <= MAX_DISK_ENTRIES:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - MAX_DISK_ENTRIES]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-from utils.db import get_posts_by_role, get_posts
-from utils.analysis import get_sentiment_analysis, get_word_frequencies, get_2d_sentiment_analysis
+import plotly.graph_objects as go
+from utils.db import role_counts_snapshot, sentiment_points_snapshot, sentiment_trend_snapshot, get_top_tokens
+from utils.analysis import score_posts
+from utils.wordcloud_cache import render_wordcloud
+from utils import perf
+
+# 词云最多展示的词语数 (WordCloud 默认 max_words)
+WORDCLOUD_TOP_K = 200
+# 情感罗盘渲染方式：点数超过该值改用 WebGL (scattergl) 渲染
+COMPASS_WEBGL_THRESHOLD = 1000
+# 点数超过该值改为按角色的二维密度 (等高线) + 分层抽样的散点
+COMPASS_DENSITY_THRESHOLD = 5000
+# 密度模式下每个坐标轴的分箱数
+COMPASS_BINS = 40
+# 密度模式下用于悬停查看内容的抽样点数 (所有角色合计)
+COMPASS_SAMPLE_SIZE = 1000
+# 情绪趋势图的时间粒度选项
+TREND_GRANULARITIES = {"day": "按天", "hour": "按小时"}
 
 def dashboard_page():
     """
@@ -17,28 +32,36 @@ def dashboard_page():
     """, unsafe_allow_html=True)
 
     # --- 1. 数据准备 ---
-    df_all = get_posts()
-    if df_all.empty:
+    # 跨会话共享的只读快照，没有新写入时不会重新查询
+    # 帖子数在 SQL 端按角色聚合；情感分析只取需要的列，不读取全部正文
+    role_counts = role_counts_snapshot()
+    total = sum(role_counts.values())
+    if total == 0:
         st.warning("暂无数据，请先去广场发几条帖子吧！")
         return
 
-    df_parent = df_all[df_all['role'] == '家长']
-    df_child = df_all[df_all['role'] == '孩子']
+    n_parent = role_counts.get('家长', 0)
+    n_child = role_counts.get('孩子', 0)
+    points = sentiment_points_snapshot()
 
     # --- 2. 核心指标 (KPIs) ---
     col1, col2, col3, col4 = st.columns(4)
     
+    # 一次性为所有帖子打分，KPI 与下方的情感罗盘共用同一份结果
+    scored = score_posts(points)
+    scored['Role'] = points['role']
+
     # 计算情感指数 (0-1, 越高越积极)
-    score_parent, _ = get_sentiment_analysis(df_parent)
-    score_child, _ = get_sentiment_analysis(df_child)
+    score_parent = _mean_valence(scored, '家长')
+    score_child = _mean_valence(scored, '孩子')
     
     # 格式化显示 (将 0-1 转换为 0-100 的“温度”)
     temp_parent = f"{int(score_parent * 100)}°C"
     temp_child = f"{int(score_child * 100)}°C"
 
-    col1.metric("总心声数量", len(df_all), "+1", border=True)
-    col2.metric("家长发帖", len(df_parent), f"{len(df_parent)/len(df_all) if len(df_all)>0 else 0:.0%}", border=True)
-    col3.metric("孩子发帖", len(df_child), f"{len(df_child)/len(df_all) if len(df_all)>0 else 0:.0%}", border=True)
+    col1.metric("总心声数量", total, "+1", border=True)
+    col2.metric("家长发帖", n_parent, f"{n_parent/total:.0%}", border=True)
+    col3.metric("孩子发帖", n_child, f"{n_child/total:.0%}", border=True)
     
     # 动态判断箭头颜色
     delta_color = "normal" if score_child > 0.5 else "inverse"
@@ -50,27 +73,23 @@ def dashboard_page():
     st.subheader("🧭 情感罗盘 (Sentiment Compass)")
     st.caption("此图表展示了社区内帖子的情感分布。X轴代表效价（不开心↔开心），Y轴代表唤醒度（平静↔激动）。")
     
-    # 获取 2D 数据
-    data_parent = get_2d_sentiment_analysis(df_parent)
-    data_child = get_2d_sentiment_analysis(df_child)
-    
-    # 组装 Plotly 数据源
-    plot_data = []
-    for item in data_parent:
-        item['Role'] = '家长'
-        plot_data.append(item)
-    for item in data_child:
-        item['Role'] = '孩子'
-        plot_data.append(item)
+    # 组装 Plotly 数据源 (x: 效价, y: 唤醒度)
+    df_plot = scored[scored['Role'].isin(['家长', '孩子'])].rename(
+        columns={'valence': 'x', 'arousal': 'y', 'snippet': 'content'}
+    )
     
-    if plot_data:
-        df_plot = pd.DataFrame(plot_data)
+    if not df_plot.empty:
         
         # 定义颜色映射
         color_map = {'家长': '#ff9f43', '孩子': '#48dbfb'}
         
+        # 点数较少时逐点 SVG 渲染；较多时 WebGL；再多则只发送密度网格和抽样点，
+        # 传给浏览器的数据量与帖子总数无关
+        density = len(df_plot) > COMPASS_DENSITY_THRESHOLD
+        points_plot = _stratified_sample(df_plot, COMPASS_SAMPLE_SIZE) if density else df_plot
+        
         fig = px.scatter(
-            df_plot, 
+            points_plot, 
             x='x', 
             y='y', 
             color='Role',
@@ -78,10 +97,18 @@ def dashboard_page():
             color_discrete_map=color_map,
             range_x=[0, 1],
             range_y=[0, 1],
+            render_mode='webgl' if len(df_plot) > COMPASS_WEBGL_THRESHOLD else 'svg',
+            opacity=0.5 if density else None,
             labels={'x': '效价 (Valence): 负面 → 正面', 'y': '唤醒度 (Arousal): 平静 → 激动'},
             title="代际情绪分布图"
         )
         
+        if density:
+            for role, color in color_map.items():
+                _add_density_trace(fig, df_plot[df_plot['Role'] == role], role, color)
+            st.caption(f"帖子较多 ({len(df_plot)} 条)，以等高线展示各角色的分布密度，"
+                       f"散点为按角色和情绪层级分层抽样的 {len(points_plot)} 条。")
+        
         # 添加象限背景线
         fig.add_hline(y=0.5, line_dash="dot", line_color="gray", opacity=0.5)
         fig.add_vline(x=0.5, line_dash="dot", line_color="gray", opacity=0.5)
@@ -92,48 +119,107 @@ def dashboard_page():
         fig.add_annotation(x=0.1, y=0.9, text="焦虑/愤怒", showarrow=False, font=dict(color="orange"))
         fig.add_annotation(x=0.9, y=0.1, text="舒适/放松", showarrow=False, font=dict(color="blue"))
         
-        st.plotly_chart(fig, use_container_width=True)
+        # 图表序列化 (数据量越大越慢) 单独计时
+        with perf.span("view.dashboard.compass_chart"):
+            st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("暂无足够数据生成图表。")
 
     st.markdown("---")
 
-    # --- 4. 关键词云 (WordClouds) ---
+    # --- 4. 情绪趋势 (Mood Trend) ---
+    st.subheader("📈 情绪趋势 (Mood Trend)")
+    st.caption("每个时间段内帖子的平均效价。数据来自发帖时增量维护的汇总表，时间跨度再长也无需重新打分。")
+    
+    granularity = st.radio("时间粒度", list(TREND_GRANULARITIES), format_func=TREND_GRANULARITIES.get,
+                           horizontal=True, key="trend_granularity")
+    trend = sentiment_trend_snapshot(granularity)
+    
+    if not trend.empty:
+        fig = px.line(
+            trend,
+            x='bucket',
+            y='valence',
+            color='role',
+            markers=True,
+            hover_data=['posts'],
+            color_discrete_map={'家长': '#ff9f43', '孩子': '#48dbfb'},
+            range_y=[0, 1],
+            labels={'bucket': '时间', 'valence': '平均效价', 'role': '角色', 'posts': '帖子数'},
+        )
+        fig.add_hline(y=0.5, line_dash="dot", line_color="gray", opacity=0.5)
+        with perf.span("view.dashboard.trend_chart"):
+            st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("暂无足够数据生成趋势图。")
+
+    st.markdown("---")
+
+    # --- 5. 关键词云 (WordClouds) ---
     st.subheader("☁️ 焦点词云 (Keywords)")
     st.caption("大家都在讨论什么？左边是家长的关注点，右边是孩子的高频词。")
 
     c1, c2 = st.columns(2)
     
     # 辅助函数：生成并绘制词云
-    def plot_wordcloud(text_data, title, col):
-        freqs = get_word_frequencies(text_data)
+    def plot_wordcloud(role, title, col):
+        # 直接读取增量维护的词频表，不再对全部帖子重新分词
+        freqs = get_top_tokens(role, k=WORDCLOUD_TOP_K)
         if not freqs:
             col.info(f"{title} 暂无足够数据")
             return
             
-        wc = WordCloud(
-            width=400, 
-            height=300, 
-            background_color='white',
-            colormap='viridis' if '孩子' in title else 'magma',
-            font_path='新青年体-文跃新青年体.ttf' # 使用支持中文的字体文件
-        ).generate_from_frequencies(freqs)
-        
-        # 修复 numpy 兼容性问题：直接转为 image 对象显示，不通过 matplotlib
-        image = wc.to_image()
+        # 词频表没变时直接命中缓存，不再重新布局 / 栅格化
+        image = render_wordcloud(freqs, colormap='viridis' if '孩子' in title else 'magma', width=400, height=300)
         col.image(image, caption=title, use_container_width=True)
 
     with c1:
-        plot_wordcloud(df_parent, "👩 家长的高频词", c1)
+        plot_wordcloud("家长", "👩 家长的高频词", c1)
         
     with c2:
-        plot_wordcloud(df_child, "👦 孩子的高频词", c2)
+        plot_wordcloud("孩子", "👦 孩子的高频词", c2)
 
-    # --- 5. 洞察总结 ---
+    # --- 6. 洞察总结 ---
     with st.expander("🧐 查看 AI 分析报告 (Beta)"):
         st.write("""
         **初步洞察：**
         1. **情绪对冲**：从散点图可以看出，家长群体的发言往往集中在"焦虑/关注"象限，而孩子群体则更多分布在"压力/宣泄"象限。
         2. **关键词差异**：家长的词云中常出现"未来"、"成绩"、"担心"，而孩子则更多提及"累"、"不理解"、"自由"。
         3. **建议**：建议双方多尝试在"舒适/放松"的话题上进行沟通，例如共同的兴趣爱好，以降低沟通阻力。
-        """)
\ No newline at end of file
+        """)
+
+def _mean_valence(scored, role):
+    """某个角色的平均效价，没有帖子时为中性 0.5"""
+    values = scored.loc[scored['Role'] == role, 'valence']
+    return values.mean() if not values.empty else 0.5
+
+def _stratified_sample(df, n):
+    """按 (角色, 情绪层级) 分层、按各层占比抽取约 n 条，每层至少保留一条；抽样结果固定"""
+    if len(df) <= n:
+        return df
+    groups = df.groupby(['Role', 'tier'], observed=True, sort=False)
+    parts = [
+        group.sample(n=max(1, round(n * len(group) / len(df))), random_state=0)
+        for _, group in groups
+    ]
+    return pd.concat(parts)
+
+def _add_density_trace(fig, df, role, color):
+    """在服务端把某个角色的点分箱成 COMPASS_BINS x COMPASS_BINS 的网格，作为等高线叠加到图上"""
+    if df.empty:
+        return
+    counts, x_edges, y_edges = np.histogram2d(
+        df['x'].to_numpy(dtype=float), df['y'].to_numpy(dtype=float),
+        bins=COMPASS_BINS, range=[[0, 1], [0, 1]]
+    )
+    fig.add_trace(go.Contour(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=counts.T,
+        name=f"{role} 密度",
+        contours_coloring='lines',
+        line=dict(color=color, width=1.5),
+        colorscale=[[0, color], [1, color]],
+        showscale=False,
+        hovertemplate=f"{role}: %{{z:.0f}} 条<extra></extra>",
+    ))
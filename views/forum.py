@@ -1,6 +1,13 @@
 import streamlit as st
 import pandas as pd
-from utils.db import add_post, get_posts_by_role, like_post, unlike_post, init_db, add_comment, get_comments
+from streamlit.errors import StreamlitInvalidLayoutContextError
+from utils import perf
+from utils.db import add_post, query_posts_snapshot, like_post, unlike_post, add_comment, get_comments, get_comments_bulk, get_comment_counts, pending_likes
+
+# 帖子流每页条数
+FEED_PAGE_SIZE = 20
+# 帖子卡片用到的列
+FEED_COLUMNS = ['id', 'role', 'nickname', 'title', 'content', 'is_hidden', 'created_at', 'likes']
 
 def forum_page():
     """
@@ -8,9 +15,6 @@ def forum_page():
     """
     # 注入样式
     _load_forum_css()
-    
-    # 确保数据库是最新的
-    init_db()
 
     # 初始化点赞记录 (Session 级)
     if "liked_posts" not in st.session_state:
@@ -35,14 +39,12 @@ def forum_page():
     # Tab 1: 显示孩子发的贴
     with tab_child:
         st.markdown('<div style="padding: 10px; background-color: #e3f2fd; border-radius: 8px; color: #1565c0; margin-bottom: 20px; font-size: 0.9rem;">💡 这里是孩子们的专属频道。各位家长，请暂时放下评判，用心倾听。</div>', unsafe_allow_html=True)
-        df_child = get_posts_by_role("孩子")
-        _render_post_list(df_child, role_type="child")
+        _render_feed("孩子", role_type="child")
 
     # Tab 2: 显示家长发的贴
     with tab_parent:
         st.markdown('<div style="padding: 10px; background-color: #fff3e0; border-radius: 8px; color: #ef6c00; margin-bottom: 20px; font-size: 0.9rem;">💡 这里是家长们的树洞。孩子们，其实大人的世界也有迷茫。</div>', unsafe_allow_html=True)
-        df_parent = get_posts_by_role("家长")
-        _render_post_list(df_parent, role_type="parent")
+        _render_feed("家长", role_type="parent")
 
 def _load_forum_css():
     st.markdown("""
@@ -152,6 +154,32 @@ def _render_post_form():
                 st.success("发布成功！")
                 st.rerun()
 
+@perf.timed("view.forum.feed")
+def _render_feed(role, role_type):
+    """
+    分页渲染某个角色的帖子流：每页 FEED_PAGE_SIZE 条，点击“加载更多”追加一页。
+    """
+    pages_key = f"feed_pages_{role_type}"
+    pages = st.session_state.get(pages_key, 1)
+
+    # 逐页按游标查询，每页都是一次走索引的范围扫描，与总帖子数无关
+    frames = []
+    cursor = None
+    for _ in range(pages):
+        # 各会话共享同一份分页快照，直到有新的写入
+        df_page, cursor = query_posts_snapshot(role=role, columns=FEED_COLUMNS, limit=FEED_PAGE_SIZE, cursor=cursor)
+        frames.append(df_page)
+        if cursor is None:
+            break
+
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    _render_post_list(df, role_type)
+
+    if cursor is not None:
+        if st.button("⬇️ 加载更多", key=f"load_more_{role_type}", use_container_width=True):
+            st.session_state[pages_key] = pages + 1
+            st.rerun()
+
 def _render_post_list(df, role_type):
     """
     渲染帖子列表
@@ -160,6 +188,14 @@ def _render_post_list(df, role_type):
         st.info("👋 还没有内容，快来发布第一条心声吧！")
         return
 
+    # 批量获取评论数 (一次查询)；评论正文只为已展开的评论区加载 (同样一次查询)
+    post_ids = df['id'].tolist()
+    comment_counts = get_comment_counts(post_ids)
+    open_ids = {pid for pid in post_ids if st.session_state.get(f"comments_{pid}")}
+    comments_by_post = get_comments_bulk(open_ids)
+    # 还在缓冲中、尚未写入存储的点赞增量
+    like_deltas = pending_likes(post_ids)
+
     # 遍历 DataFrame 渲染每一行
     for index, row in df.iterrows():
         # 处理显示数据
@@ -169,6 +205,7 @@ def _render_post_list(df, role_type):
         
         post_id = row['id']
         likes = row['likes'] if pd.notna(row['likes']) else 0
+        likes = max(0, int(likes) + like_deltas.get(post_id, 0))
         
         # 显式格式化时间，防止显示为 00:00:00 或默认格式
         try:
@@ -176,9 +213,7 @@ def _render_post_list(df, role_type):
         except:
             created_at_str = str(row['created_at'])
 
-        # 获取评论
-        comments_df = get_comments(post_id)
-        comment_count = len(comments_df)
+        comment_count = comment_counts.get(post_id, 0)
 
         # CSS 类名选择
         card_class = "card-parent" if role_type == "parent" else "card-child"
@@ -201,54 +236,88 @@ def _render_post_list(df, role_type):
                 </div>
             """, unsafe_allow_html=True)
             
-            # --- 交互区 (点赞 + 评论) ---
-            col_like, col_spacer = st.columns([0.2, 0.8])
-            with col_like:
-                btn_key = f"like_{post_id}"
-                is_liked = post_id in st.session_state["liked_posts"]
-                
-                if is_liked:
-                    if st.button(f"❤️ {int(likes)}", key=btn_key):
-                        unlike_post(post_id)
-                        st.session_state["liked_posts"].remove(post_id)
-                        st.rerun()
-                else:
-                    if st.button(f"🤍 {int(likes)}", key=btn_key):
-                        like_post(post_id)
-                        st.session_state["liked_posts"].add(post_id)
-                        st.rerun()
-            
-            # --- 评论区 (Expander) ---
-            with st.expander(f"💬 评论 ({comment_count})", expanded=False):
-                # 1. 显示已有评论
-                if not comments_df.empty:
-                    for c_idx, c_row in comments_df.iterrows():
-                        c_role = c_row['role']
-                        c_nick = c_row['nickname']
-                        c_content = c_row['content']
-                        c_badge_color = "#48dbfb" if c_role == "孩子" else "#ff9f43"
-                        
-                        st.markdown(f"""
-                            <div class="comment-box">
-                                <div class="comment-meta">
-                                    <span style="color:{c_badge_color}; font-weight:bold;">{c_nick}</span> 说:
-                                </div>
-                                <div>{c_content}</div>
-                            </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.caption("暂无评论，来抢沙发吧~")
-                
-                # 2. 发送新评论表单
-                # 使用唯一的 key 防止冲突
-                with st.form(key=f"comment_form_{post_id}", clear_on_submit=True):
-                    new_comment = st.text_input("写下你的看法...", placeholder="友善评论，温暖你我")
-                    submitted_comment = st.form_submit_button("发送")
-                    if submitted_comment and new_comment:
-                        current_role = st.session_state.get("role", "游客")
-                        current_nickname = st.session_state.get("nickname", "匿名用户")
-                        add_comment(post_id, current_role, current_nickname, new_comment)
-                        st.success("评论成功！")
-                        st.rerun()
+            # --- 交互区 (点赞 + 评论)：独立的 fragment，点击只重跑这一张卡片 ---
+            comments_df = comments_by_post.get(post_id, pd.DataFrame()) if post_id in open_ids else None
+            _render_post_actions(post_id, likes, post_id in st.session_state["liked_posts"],
+                                 comment_count, comments_df)
             
             st.markdown("---") # 分割线
+
+@st.fragment
+@perf.timed("view.forum.post_actions")
+def _render_post_actions(post_id, likes, was_liked, comment_count, comments_df):
+    """
+    单个帖子的点赞与评论区。点赞、展开评论、发表评论都只重跑这个 fragment，
+    不再重新执行整个页面 (重新查询帖子流、重新统计所有帖子的评论数)。
+    fragment 重跑时参数仍是整页渲染时的值，因此点赞数按本会话此后的点赞状态修正，
+    评论在本 fragment 内有写入或新展开时重新查询这一个帖子的评论。
+    """
+    # --- 点赞 ---
+    col_like, col_spacer = st.columns([0.2, 0.8])
+    with col_like:
+        btn_key = f"like_{post_id}"
+        is_liked = post_id in st.session_state["liked_posts"]
+        shown_likes = max(0, likes + int(is_liked) - int(was_liked))
+        
+        if is_liked:
+            if st.button(f"❤️ {shown_likes}", key=btn_key):
+                unlike_post(post_id)
+                st.session_state["liked_posts"].remove(post_id)
+                _rerun_card()
+        else:
+            if st.button(f"🤍 {shown_likes}", key=btn_key):
+                like_post(post_id)
+                st.session_state["liked_posts"].add(post_id)
+                _rerun_card()
+    
+    # --- 评论区 (Expander) ---
+    # 开启状态跟踪：折叠时不渲染评论内容，展开时才加载
+    box_key = f"comments_{post_id}"
+    stale_key = f"comments_stale_{post_id}"
+    if st.session_state.get(box_key):
+        if comments_df is None or st.session_state.pop(stale_key, False):
+            comments_df = get_comments(post_id)
+        comment_count = len(comments_df)
+
+    comment_box = st.expander(f"💬 评论 ({comment_count})", expanded=False,
+                              key=box_key, on_change="rerun")
+    with comment_box:
+        if comment_box.open:
+            # 1. 显示已有评论
+            if comments_df is not None and not comments_df.empty:
+                for c_idx, c_row in comments_df.iterrows():
+                    c_role = c_row['role']
+                    c_nick = c_row['nickname']
+                    c_content = c_row['content']
+                    c_badge_color = "#48dbfb" if c_role == "孩子" else "#ff9f43"
+                
+                    st.markdown(f"""
+                        <div class="comment-box">
+                            <div class="comment-meta">
+                                <span style="color:{c_badge_color}; font-weight:bold;">{c_nick}</span> 说:
+                            </div>
+                            <div>{c_content}</div>
+                        </div>
+                    """, unsafe_allow_html=True)
+            else:
+                st.caption("暂无评论，来抢沙发吧~")
+        
+            # 2. 发送新评论表单
+            # 使用唯一的 key 防止冲突
+            with st.form(key=f"comment_form_{post_id}", clear_on_submit=True):
+                new_comment = st.text_input("写下你的看法...", placeholder="友善评论，温暖你我")
+                submitted_comment = st.form_submit_button("发送")
+                if submitted_comment and new_comment:
+                    current_role = st.session_state.get("role", "游客")
+                    current_nickname = st.session_state.get("nickname", "匿名用户")
+                    add_comment(post_id, current_role, current_nickname, new_comment)
+                    st.success("评论成功！")
+                    st.session_state[stale_key] = True
+                    _rerun_card()
+
+def _rerun_card():
+    """只重跑当前帖子卡片；点击是在整页运行中处理的 (例如 AppTest) 时退回整页重跑"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitInvalidLayoutContextError:
+        st.rerun()